@@ -8,12 +8,13 @@ async def send_business_media_copy(
     chat_id: int,
     message: Message,
     business_connection_id: str,
+    caption: str | None = None,
 ) -> Message:
     """Re-send media to a chat on behalf of the business account owner."""
     kwargs = {
         "chat_id": chat_id,
         "business_connection_id": business_connection_id,
-        "caption": message.caption,
+        "caption": caption if caption is not None else message.caption,
     }
 
     if message.video:
@@ -16,6 +16,8 @@ class ConnectionStore:
         self._connection_id: str | None = None
         self._user_id: int | None = None
         self._relay_pending_until: float = 0.0
+        # Relay URL message id → (url, expiry), so answers can be tagged with the request they belong to.
+        self._relays: dict[int, tuple[str, float]] = {}
         self.load()
 
     def load(self) -> None:
@@ -68,8 +70,22 @@ class ConnectionStore:
     def is_connected(self) -> bool:
         return bool(self.get_connection_id())
 
-    def mark_relay_pending(self) -> None:
-        self._relay_pending_until = time.monotonic() + RELAY_PENDING_SECONDS
+    def mark_relay_pending(self, message_id: int | None = None, url: str = "") -> None:
+        now = time.monotonic()
+        self._relay_pending_until = now + RELAY_PENDING_SECONDS
+        self._relays = {key: value for key, value in self._relays.items() if value[1] > now}
+        if message_id is not None:
+            self._relays[message_id] = (url, now + RELAY_PENDING_SECONDS)
+
+    def find_relay(self, reply_to_message_id: int | None, text: str) -> int | None:
+        """Relay message id an answer belongs to: the message it replies to, else the relay whose URL it echoes."""
+        now = time.monotonic()
+        if reply_to_message_id in self._relays and self._relays[reply_to_message_id][1] > now:
+            return reply_to_message_id
+        for message_id, (url, expires) in self._relays.items():
+            if url and url in text and expires > now:
+                return message_id
+        return None
 
     def is_relay_pending(self) -> bool:
         return time.monotonic() < self._relay_pending_until
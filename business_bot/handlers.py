@@ -14,6 +14,8 @@ from business_bot.connection_store import ConnectionStore
 
 logger = logging.getLogger(__name__)
 
+MAX_CAPTION_LENGTH = 1024
+
 
 def is_downloader_sender(message: Message) -> bool:
     if not message.from_user:
@@ -47,6 +49,16 @@ def should_forward_relay_media(message: Message, store: ConnectionStore, source:
     return False
 
 
+def tag_relay_caption(caption: str | None, relay_id: int | None) -> str | None:
+    """Append the ``#relay<id>`` tag the main bot matches answers by, keeping within the caption limit."""
+    if relay_id is None:
+        return caption
+    tag = f"#relay{relay_id}"
+    if not caption:
+        return tag
+    return f"{caption[: MAX_CAPTION_LENGTH - len(tag) - 1]}\n{tag}"
+
+
 async def forward_video_to_main_bot(
     bot: Bot,
     store: ConnectionStore,
@@ -74,18 +86,24 @@ async def forward_video_to_main_bot(
         sender_id,
     )
 
+    relay_id = store.find_relay(
+        message.reply_to_message.message_id if message.reply_to_message else None,
+        message.caption or "",
+    )
     try:
         sent = await send_business_media_copy(
             bot,
             chat_id=MAIN_BOT_USER_ID,
             message=message,
             business_connection_id=connection_id,
+            caption=tag_relay_caption(message.caption, relay_id),
         )
         logger.info(
-            "Forwarded video msg_id=%s to main bot user=%s as msg_id=%s",
+            "Forwarded video msg_id=%s to main bot user=%s as msg_id=%s relay_id=%s",
             message.message_id,
             MAIN_BOT_USER_ID,
             sent.message_id,
+            relay_id,
         )
         return True
     except Exception as exc:
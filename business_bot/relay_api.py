@@ -86,7 +86,7 @@ def create_relay_app(bot: Bot, store: ConnectionStore) -> web.Application:
                 sent = await bot.send_message(chat_id=downloader_chat_id, text=url)
                 send_mode = "bot_to_bot"
 
-            store.mark_relay_pending()
+            store.mark_relay_pending(sent.message_id, url)
             logger.info(
                 "Relay sent url=%s via %s chat=%s msg_id=%s",
                 url,
@@ -14,6 +14,8 @@ YTDLP_COOKIES_FILE = os.environ.get("YTDLP_COOKIES_FILE", "")
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 jobs: dict[str, dict] = {}
+# Guards the cancelled flag against the worker's final status, so a late cancel is never overwritten.
+jobs_lock = threading.Lock()
 
 
 def build_ytdlp_cmd(base_cmd: list[str]) -> list[str]:
@@ -22,6 +24,23 @@ def build_ytdlp_cmd(base_cmd: list[str]) -> list[str]:
     return base_cmd
 
 
+def remove_job_files(job_id: str) -> None:
+    for file_name in glob.glob(os.path.join(DOWNLOAD_DIR, f"{job_id}.*")):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+
+def finish_job(job_id: str, **fields) -> None:
+    job = jobs[job_id]
+    with jobs_lock:
+        if not job.get("cancelled"):
+            job.update(fields)
+            return
+    remove_job_files(job_id)
+
+
 def run_download(job_id: str, url: str, format_choice: str, format_id: str | None) -> None:
     job = jobs[job_id]
     out_template = os.path.join(DOWNLOAD_DIR, f"{job_id}.%(ext)s")
@@ -37,16 +56,24 @@ def run_download(job_id: str, url: str, format_choice: str, format_id: str | Non
     cmd.append(url)
 
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-        if result.returncode != 0:
-            job["status"] = "error"
-            job["error"] = result.stderr.strip().split("\n")[-1]
+        with jobs_lock:
+            if job.get("cancelled"):
+                return
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            job["process"] = process
+        try:
+            _, stderr = process.communicate(timeout=300)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        if process.returncode != 0:
+            finish_job(job_id, status="error", error=stderr.strip().split("\n")[-1])
             return
 
         files = glob.glob(os.path.join(DOWNLOAD_DIR, f"{job_id}.*"))
         if not files:
-            job["status"] = "error"
-            job["error"] = "Download completed but no file was found"
+            finish_job(job_id, status="error", error="Download completed but no file was found")
             return
 
         if format_choice == "audio":
@@ -62,21 +89,26 @@ def run_download(job_id: str, url: str, format_choice: str, format_id: str | Non
                 except OSError:
                     pass
 
-        job["status"] = "done"
-        job["file"] = chosen
         ext = os.path.splitext(chosen)[1]
         title = job.get("title", "").strip()
+        filename = os.path.basename(chosen)
         if title:
             safe_title = "".join(char for char in title if char not in r'\/:*?"<>|').strip()[:80].strip()
-            job["filename"] = f"{safe_title}{ext}" if safe_title else os.path.basename(chosen)
-        else:
-            job["filename"] = os.path.basename(chosen)
+            if safe_title:
+                filename = f"{safe_title}{ext}"
+        finish_job(job_id, status="done", file=chosen, filename=filename)
     except subprocess.TimeoutExpired:
-        job["status"] = "error"
-        job["error"] = "Download timed out (5 min limit)"
+        finish_job(job_id, status="error", error="Download timed out (5 min limit)")
     except Exception as exc:
-        job["status"] = "error"
-        job["error"] = str(exc)
+        finish_job(job_id, status="error", error=str(exc))
+
+
+def size_fields(fmt: dict) -> dict:
+    return {
+        "filesize": fmt.get("filesize"),
+        "filesize_approx": fmt.get("filesize_approx"),
+        "tbr": fmt.get("tbr") or fmt.get("abr"),
+    }
 
 
 @app.route("/")
@@ -116,10 +148,19 @@ def get_info():
                     "id": str(fmt["format_id"]),
                     "label": f"{height}p",
                     "height": height,
+                    "has_audio": fmt.get("acodec", "none") != "none",
+                    **size_fields(fmt),
                 }
             )
         formats.sort(key=lambda item: item["height"], reverse=True)
 
+        audio_formats = [
+            fmt
+            for fmt in info.get("formats", [])
+            if fmt.get("vcodec", "none") == "none" and fmt.get("acodec", "none") != "none"
+        ]
+        best_audio = max(audio_formats, key=lambda fmt: fmt.get("abr") or fmt.get("tbr") or 0, default=None)
+
         return jsonify(
             {
                 "title": info.get("title", ""),
@@ -127,6 +168,7 @@ def get_info():
                 "duration": info.get("duration"),
                 "uploader": info.get("uploader", ""),
                 "formats": formats,
+                "audio": size_fields(best_audio) if best_audio else None,
                 "direct_url": direct_url,
             }
         )
@@ -172,6 +214,21 @@ def check_status(job_id: str):
     )
 
 
+@app.route("/api/cancel/<job_id>", methods=["POST"])
+def cancel_download(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    with jobs_lock:
+        job["cancelled"] = True
+        job["status"] = "cancelled"
+        process = job.get("process")
+    if process and process.poll() is None:
+        process.kill()
+    remove_job_files(job_id)
+    return jsonify({"ok": True})
+
+
 @app.route("/api/file/<job_id>")
 def download_file(job_id: str):
     job = jobs.get(job_id)
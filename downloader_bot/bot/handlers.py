@@ -1,5 +1,4 @@
 import logging
-import re
 import urllib.parse
 import uuid
 
@@ -14,14 +13,16 @@ from aiogram.types import (
     Message,
 )
 
-from downloader_bot.bot.messages import MESSAGES, SUPPORTED_DOMAINS
+from downloader_bot.bot.messages import MESSAGES
+from downloader_bot.canonical_url import canonicalize_url, find_supported_url
 from downloader_bot.config import RESTRICTED_THREADS
+from downloader_bot.infrastructure.http_client import HttpClient
 from downloader_bot.infrastructure.temp_files import cleanup_temp_dir, create_video_temp_dir
 from downloader_bot.media.ffmpeg import create_first_frame_thumbnail_from_remote
 from downloader_bot.media.telegraph import upload_image_to_telegra_ph
 from downloader_bot.services.download_service import DownloadService
 from downloader_bot.services.relay_service import RelayService
-from downloader_bot.services.video_delivery import VideoDeliveryService
+from downloader_bot.services.video_delivery import VideoDeliveryService, delivery_target
 
 
 def register_handlers(
@@ -30,6 +31,7 @@ def register_handlers(
     download_service: DownloadService,
     delivery_service: VideoDeliveryService,
     relay_service: RelayService,
+    http_client: HttpClient,
 ) -> None:
     @dp.message(Command("start", "help"))
     async def send_welcome(message: Message) -> None:
@@ -46,10 +48,11 @@ def register_handlers(
             await query.answer([], is_personal=True, cache_time=1)
             return
 
-        url = extract_url_from_text(text) or text
-        if not is_supported_url(url):
+        canonical = find_supported_url(text) or canonicalize_url(text)
+        if not canonical:
             await query.answer([], is_personal=True, cache_time=1)
             return
+        url = canonical.url
 
         info = await download_service.get_video_info(url)
         video_url = sanitize_http_url(info.direct_url) if info else None
@@ -61,7 +64,7 @@ def register_handlers(
             temp_dir = create_video_temp_dir("inline")
             local_thumb = await create_first_frame_thumbnail_from_remote(video_url, temp_dir)
             if local_thumb:
-                uploaded_thumb = await upload_image_to_telegra_ph(local_thumb)
+                uploaded_thumb = await upload_image_to_telegra_ph(http_client, local_thumb)
                 if uploaded_thumb:
                     thumb_url = uploaded_thumb
             cleanup_temp_dir(temp_dir)
@@ -86,10 +89,11 @@ def register_handlers(
         text = message.text or ""
         if message.message_thread_id in RESTRICTED_THREADS:
             return
-        if not is_supported_url(text):
+        canonical = find_supported_url(text)
+        if not canonical:
             return
 
-        url = extract_url_from_text(text) or text
+        url = canonical.url
         user_mention = get_user_mention(message)
         processing_msg = await bot.send_message(
             chat_id=message.chat.id,
@@ -97,29 +101,21 @@ def register_handlers(
             message_thread_id=message.message_thread_id,
         )
 
+        target = delivery_target(message)
         try:
             await relay_service.submit(
-                message=message,
+                target=target,
                 url=url,
                 user_mention=user_mention,
                 processing_message_id=processing_msg.message_id,
+                user_id=message.from_user.id if message.from_user else message.chat.id,
             )
         except Exception as exc:
             logging.exception("Relay submit failed: %s", exc)
-            await delivery_service.send_message_to_chat(message, MESSAGES["error_download"])
+            await delivery_service.send_message_to_chat(target, MESSAGES["error_download"])
             await processing_msg.delete()
 
 
-def extract_url_from_text(text: str) -> str | None:
-    url_pattern = r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?[-\w%&=.]*)?\S*"
-    matches = re.findall(url_pattern, text)
-    return matches[0] if matches else None
-
-
-def is_supported_url(text: str) -> bool:
-    return any(domain in text.lower() for domain in SUPPORTED_DOMAINS)
-
-
 def get_user_mention(message: Message) -> str:
     if message.from_user:
         if message.from_user.username:
@@ -29,12 +29,15 @@ SUPPORTED_DOMAINS = [
 MESSAGES = {
     "welcome": "👋 Привет! Отправь мне ссылку на видео с поддерживаемых платформ — я передам её на скачивание и пришлю результат.",
     "processing": "⏳ Передаю ссылку на скачивание...",
+    "queued": "🕒 Ссылка в очереди: {}-я. Начну, как только освободится место.",
+    "queue_full": "🚦 Сейчас слишком много запросов. Попробуй отправить ссылку ещё раз через пару минут.",
     "success": "{}",
     "error_download": "❌ Не удалось скачать видео. Пожалуйста, проверь ссылку и попробуй еще раз.",
     "error_send": "Ошибка при отправке видео: {}",
     "file_too_large": "Файл слишком большой ({}MB). Подготавливаю видео для отправки...",
     "file_extremely_large": "⚠️ Файл слишком большой ({}MB) и превышает лимит в 500MB. Невозможно отправить.",
     "sending_part": "{}/{}...",
+    "sending_part_number": "Часть {}...",
     "sending_complete": "✅ Все части видео отправлены!",
     "splitting_error": "❌ Ошибка при разделении видео. Пожалуйста, попробуйте другую ссылку.",
 }
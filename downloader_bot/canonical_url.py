@@ -0,0 +1,189 @@
+import re
+import urllib.parse
+from dataclasses import dataclass
+
+from downloader_bot.bot.messages import SUPPORTED_DOMAINS
+
+URL_PATTERN = re.compile(r"https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?[-\w%&=.]*)?\S*")
+
+# Domains whose platform name is not simply their first label.
+_PLATFORM_ALIASES = {
+    "youtu.be": "youtube",
+    "x.com": "twitter",
+    "bsky.app": "bluesky",
+    "pin.it": "pinterest",
+}
+
+PLATFORM_BY_DOMAIN: dict[str, str] = {
+    domain: _PLATFORM_ALIASES.get(domain, domain.split(".", 1)[0]) for domain in SUPPORTED_DOMAINS
+}
+
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "mbasic.", "web.", "old.", "new.")
+
+TRACKING_PARAMS = frozenset(
+    {
+        "si",
+        "igsh",
+        "igshid",
+        "fbclid",
+        "gclid",
+        "yclid",
+        "feature",
+        "ref",
+        "ref_src",
+        "ref_url",
+        "share_id",
+        "share_source",
+        "share_app_id",
+        "is_from_webapp",
+        "sender_device",
+        "_r",
+        "_t",
+    }
+)
+_PLATFORM_TRACKING_PARAMS = {
+    "youtube": frozenset({"pp", "ab_channel"}),
+    "twitter": frozenset({"s", "t"}),
+}
+
+_YOUTUBE_ID = re.compile(r"^[\w-]{6,}$")
+_YOUTUBE_PATH = re.compile(r"^/(?:shorts|embed|live|v)/([\w-]+)")
+_TIKTOK_VIDEO = re.compile(r"/(?:video|photo|v)/(\d+)")
+# Share links that redirect to a video: keyed by their short code, since resolving them needs a request.
+_TIKTOK_SHORT_HOSTS = frozenset({"vm.tiktok.com", "vt.tiktok.com"})
+_TIKTOK_SHORT_PATH = re.compile(r"^/(?:t/)?([\w-]+)/?$")
+_INSTAGRAM_MEDIA = re.compile(r"^/(?:[\w.]+/)?(?:p|reel|reels|tv)/([\w-]+)")
+_TWITTER_STATUS = re.compile(r"/status(?:es)?/(\d+)")
+_VK_VIDEO = re.compile(r"(?:video|clip)(-?\d+_\d+)")
+
+# Sentence punctuation that ends up glued to a link in message text.
+_TRAILING_PUNCTUATION = ".,;:!?)]}>\"'»…"
+
+
+@dataclass(frozen=True)
+class CanonicalUrl:
+    url: str
+    platform: str
+    media_id: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.platform}:{self.media_id}"
+
+
+def match_platform(host: str) -> str | None:
+    """Exact hostname match against supported domains and their parents: O(labels), not O(domains)."""
+    host = host.lower().rstrip(".")
+    labels = host.split(".")
+    for index in range(len(labels) - 1):
+        platform = PLATFORM_BY_DOMAIN.get(".".join(labels[index:]))
+        if platform:
+            return platform
+    return None
+
+
+def _strip_host_prefixes(host: str) -> str:
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix) and host.count(".") > 1:
+            return host[len(prefix):]
+    return host
+
+
+def _clean_query(query: str, platform: str) -> list[tuple[str, str]]:
+    extra = _PLATFORM_TRACKING_PARAMS.get(platform, frozenset())
+    return [
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and key.lower() not in extra and not key.lower().startswith("utm_")
+    ]
+
+
+def _youtube(host: str, path: str, query: list[tuple[str, str]]) -> CanonicalUrl | None:
+    video_id = None
+    if host == "youtu.be":
+        video_id = path.strip("/").split("/", 1)[0]
+    else:
+        match = _YOUTUBE_PATH.match(path)
+        if match:
+            video_id = match.group(1)
+        elif path.rstrip("/") == "/watch":
+            video_id = dict(query).get("v")
+    if not video_id or not _YOUTUBE_ID.match(video_id):
+        return None
+    return CanonicalUrl(url=f"https://www.youtube.com/watch?v={video_id}", platform="youtube", media_id=video_id)
+
+
+def _tiktok_short(host: str, path: str) -> CanonicalUrl | None:
+    if host not in _TIKTOK_SHORT_HOSTS and not path.startswith("/t/"):
+        return None
+    match = _TIKTOK_SHORT_PATH.match(path)
+    if not match:
+        return None
+    code = match.group(1)
+    if host in _TIKTOK_SHORT_HOSTS:
+        kind = host.split(".", 1)[0]
+        return CanonicalUrl(url=f"https://{host}/{code}/", platform="tiktok", media_id=f"{kind}/{code}")
+    return CanonicalUrl(url=f"https://{host}/t/{code}/", platform="tiktok", media_id=f"t/{code}")
+
+
+def _strip_trailing_punctuation(url: str) -> str:
+    while url and url[-1] in _TRAILING_PUNCTUATION:
+        if url[-1] == ")" and url.count("(") >= url.count(")"):
+            break
+        url = url[:-1]
+    return url
+
+
+def _by_pattern(platform: str, pattern: re.Pattern[str], path: str, url: str) -> CanonicalUrl | None:
+    match = pattern.search(path)
+    if not match:
+        return None
+    return CanonicalUrl(url=url, platform=platform, media_id=match.group(1))
+
+
+def canonicalize_url(raw_url: str) -> CanonicalUrl | None:
+    raw_url = _strip_trailing_punctuation(raw_url.strip())
+    if not raw_url.lower().startswith(("http://", "https://")):
+        return None
+    try:
+        parts = urllib.parse.urlsplit(raw_url)
+    except ValueError:
+        return None
+
+    host = (parts.hostname or "").lower().rstrip(".")
+    platform = match_platform(host)
+    if not platform:
+        return None
+
+    host = _strip_host_prefixes(host)
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    query = _clean_query(parts.query, platform)
+    clean_query = urllib.parse.urlencode(query)
+    url = urllib.parse.urlunsplit(("https", host, path, clean_query, ""))
+
+    canonical = None
+    if platform == "youtube":
+        canonical = _youtube(host, path, query)
+    elif platform == "tiktok":
+        canonical = _by_pattern(platform, _TIKTOK_VIDEO, path, url) or _tiktok_short(host, path)
+    elif platform == "instagram":
+        canonical = _by_pattern(platform, _INSTAGRAM_MEDIA, path, url)
+    elif platform == "twitter":
+        canonical = _by_pattern(platform, _TWITTER_STATUS, path, url)
+    elif platform == "vk":
+        canonical = _by_pattern(platform, _VK_VIDEO, f"{path}?{parts.query}", url)
+    if canonical:
+        return canonical
+
+    media_id = f"{host}{path.rstrip('/')}"
+    if clean_query:
+        media_id = f"{media_id}?{urllib.parse.urlencode(sorted(query))}"
+    return CanonicalUrl(url=url, platform=platform, media_id=media_id)
+
+
+def find_supported_url(text: str) -> CanonicalUrl | None:
+    for match in URL_PATTERN.finditer(text):
+        canonical = canonicalize_url(match.group(0))
+        if canonical:
+            return canonical
+    return None
@@ -1,10 +1,26 @@
+import asyncio
 import logging
 import os
 
-import aiofiles
 import aiohttp
 
-from downloader_bot.config import COBALT_API_KEY, COBALT_API_URL, VIDEO_QUALITY
+from downloader_bot.config import (
+    COBALT_API_KEY,
+    COBALT_API_URL,
+    MAX_SINGLE_FILE_SIZE,
+    MAX_TOTAL_FILE_SIZE,
+    RANGED_DOWNLOAD_CONNECTIONS,
+    VIDEO_QUALITY,
+)
+from downloader_bot.infrastructure.http_client import (
+    BACKEND_COBALT,
+    BACKEND_MEDIA,
+    BackendUnavailableError,
+    HttpClient,
+)
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.infrastructure.ranged_download import RangeDownloadError, download_ranged
+from downloader_bot.infrastructure.streaming import FileTooLargeError, predicted_size, stream_response_to_file
 from downloader_bot.infrastructure.temp_files import cleanup_temp_dir, create_video_temp_dir
 from downloader_bot.media.ffmpeg import bytes_to_mb
 from downloader_bot.models import DownloadResult, VideoInfo
@@ -13,10 +29,12 @@ from downloader_bot.models import DownloadResult, VideoInfo
 class CobaltClient:
     def __init__(
         self,
+        http_client: HttpClient,
         api_url: str = COBALT_API_URL,
         api_key: str = COBALT_API_KEY,
         video_quality: str = VIDEO_QUALITY,
     ) -> None:
+        self.http_client = http_client
         self.api_url = api_url
         self.api_key = api_key
         self.video_quality = video_quality
@@ -30,10 +48,10 @@ class CobaltClient:
             headers["Authorization"] = f"Api-Key {self.api_key}"
         return headers
 
-    def _payload(self, url: str) -> dict[str, object]:
+    def _payload(self, url: str, quality: str | None = None) -> dict[str, object]:
         return {
             "url": url,
-            "videoQuality": self.video_quality,
+            "videoQuality": quality or self.video_quality,
             "audioFormat": "mp3",
             "filenameStyle": "basic",
             "alwaysProxy": True,
@@ -47,49 +65,74 @@ class CobaltClient:
         stem = filename.rsplit(".", 1)[0] if "." in filename else filename
         return f"{stem}.mp4"
 
-    async def download(self, url: str) -> DownloadResult | None:
+    async def download(self, url: str, ladder: list[int] | None = None) -> DownloadResult | None:
+        """Download the first rendition on ``ladder`` whose announced size fits a single upload.
+
+        Returns None when cobalt cannot serve this URL; raises BackendUnavailableError when cobalt itself fails.
+        """
+        qualities = [str(height) for height in ladder] if ladder else [self.video_quality]
+        for index, quality in enumerate(qualities):
+            is_last = index == len(qualities) - 1
+            try:
+                return await self._download_rendition(url, quality, None if is_last else MAX_SINGLE_FILE_SIZE)
+            except FileTooLargeError as exc:
+                if is_last:
+                    logging.error("Cobalt download aborted for %s: %s", url, exc)
+                    return None
+                logging.info(
+                    "Cobalt %sp rendition of %s is too large (%s), trying %sp",
+                    quality,
+                    url,
+                    exc,
+                    qualities[index + 1],
+                )
+                metrics.inc("quality_step_downs", backend="cobalt")
+        return None
+
+    async def _download_rendition(self, url: str, quality: str, step_down_above: int | None) -> DownloadResult | None:
         video_dir = create_video_temp_dir()
         try:
-            logging.info("Sending request to cobalt-api at %s", self.api_url)
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, json=self._payload(url), headers=self._headers()) as response:
-                    result = await response.json()
-
-                if result.get("status") == "error":
-                    logging.error("Cobalt error while downloading: %s", result.get("error", {}))
-                    cleanup_temp_dir(video_dir)
-                    return None
+            logging.info("Sending request to cobalt-api at %s (quality %s)", self.api_url, quality)
+            session = self.http_client.session(BACKEND_COBALT)
+            async with session.post(self.api_url, json=self._payload(url, quality), headers=self._headers()) as response:
+                if response.status >= 500:
+                    raise BackendUnavailableError(f"cobalt-api HTTP {response.status}")
+                result = await response.json()
 
-                if result.get("status") not in ["tunnel", "redirect"]:
-                    logging.error("Unexpected cobalt response status: %s", result.get("status"))
-                    cleanup_temp_dir(video_dir)
-                    return None
+            if result.get("status") == "error":
+                logging.error("Cobalt error while downloading: %s", result.get("error", {}))
+                cleanup_temp_dir(video_dir)
+                return None
 
-                download_url = result.get("url")
-                if not download_url:
-                    logging.error("Cobalt response did not include a download URL")
-                    cleanup_temp_dir(video_dir)
-                    return None
+            if result.get("status") not in ["tunnel", "redirect"]:
+                logging.error("Unexpected cobalt response status: %s", result.get("status"))
+                cleanup_temp_dir(video_dir)
+                return None
 
-                filename = self._ensure_mp4(result.get("filename"))
-                local_path = os.path.join(video_dir, filename)
-
-                async with session.get(download_url) as file_response:
-                    if file_response.status != 200:
-                        logging.error("Error downloading cobalt file: HTTP %s", file_response.status)
-                        cleanup_temp_dir(video_dir)
-                        return None
-                    async with aiofiles.open(local_path, "wb") as file_obj:
-                        await file_obj.write(await file_response.read())
-
-                file_size = os.path.getsize(local_path)
-                if file_size <= 0:
-                    logging.error("Downloaded cobalt file is empty")
-                    cleanup_temp_dir(video_dir)
-                    return None
+            download_url = result.get("url")
+            if not download_url:
+                logging.error("Cobalt response did not include a download URL")
+                cleanup_temp_dir(video_dir)
+                return None
+
+            filename = self._ensure_mp4(result.get("filename"))
+            local_path = os.path.join(video_dir, filename)
 
-                logging.info("Downloaded cobalt file size: %.2fMB", bytes_to_mb(file_size))
-                return DownloadResult(local_path=local_path, filename=filename, temp_dir=video_dir, source="cobalt")
+            if not await self._fetch_file(download_url, local_path, result.get("status"), step_down_above):
+                cleanup_temp_dir(video_dir)
+                return None
+
+            file_size = os.path.getsize(local_path)
+            if file_size <= 0:
+                logging.error("Downloaded cobalt file is empty")
+                cleanup_temp_dir(video_dir)
+                return None
+
+            logging.info("Downloaded cobalt file size: %.2fMB", bytes_to_mb(file_size))
+            return DownloadResult(local_path=local_path, filename=filename, temp_dir=video_dir, source="cobalt")
+        except (FileTooLargeError, BackendUnavailableError):
+            cleanup_temp_dir(video_dir)
+            raise
         except aiohttp.ClientConnectorError as exc:
             logging.error(
                 "Cobalt connection failed at %s (%s): %s. "
@@ -99,18 +142,55 @@ class CobaltClient:
                 exc,
             )
             cleanup_temp_dir(video_dir)
-            return None
+            raise BackendUnavailableError(str(exc)) from exc
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logging.error("Cobalt request failed at %s (%s): %s", self.api_url, type(exc).__name__, exc)
+            cleanup_temp_dir(video_dir)
+            raise BackendUnavailableError(str(exc)) from exc
+        except asyncio.CancelledError:
+            logging.info("Cobalt download cancelled for %s", url)
+            cleanup_temp_dir(video_dir)
+            raise
         except Exception as exc:
             logging.error("Error during cobalt download at %s (%s): %s", self.api_url, type(exc).__name__, exc)
             cleanup_temp_dir(video_dir)
             return None
 
+    async def _fetch_file(
+        self,
+        download_url: str,
+        local_path: str,
+        status: str,
+        step_down_above: int | None = None,
+    ) -> bool:
+        """Raises FileTooLargeError before reading the body when the announced size exceeds ``step_down_above``."""
+        media_session = self.http_client.session(BACKEND_MEDIA)
+        if status == "redirect" and RANGED_DOWNLOAD_CONNECTIONS > 1:
+            max_bytes = min(step_down_above, MAX_TOTAL_FILE_SIZE) if step_down_above else MAX_TOTAL_FILE_SIZE
+            try:
+                if await download_ranged(media_session, download_url, local_path, source="cobalt", max_bytes=max_bytes):
+                    return True
+            except (aiohttp.ClientError, asyncio.TimeoutError, RangeDownloadError) as exc:
+                logging.warning("Ranged cobalt download failed (%s), falling back to a single stream", exc)
+
+        async with media_session.get(download_url) as file_response:
+            if file_response.status >= 500:
+                raise BackendUnavailableError(f"cobalt file HTTP {file_response.status}")
+            if file_response.status != 200:
+                logging.error("Error downloading cobalt file: HTTP %s", file_response.status)
+                return False
+            announced = predicted_size(file_response)
+            if step_down_above and announced and announced > step_down_above:
+                raise FileTooLargeError(announced, step_down_above)
+            await stream_response_to_file(file_response, local_path, source="cobalt")
+        return True
+
     async def get_video_info(self, url: str) -> VideoInfo | None:
         try:
             logging.info("Requesting direct URL from cobalt-api at %s", self.api_url)
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, json=self._payload(url), headers=self._headers()) as response:
-                    result = await response.json()
+            session = self.http_client.session(BACKEND_COBALT)
+            async with session.post(self.api_url, json=self._payload(url), headers=self._headers()) as response:
+                result = await response.json()
 
             if result.get("status") == "error":
                 logging.error("Cobalt error while getting info: %s", result.get("error", {}))
@@ -3,15 +3,23 @@ import logging
 import os
 import time
 
-import aiofiles
 import aiohttp
 
 from downloader_bot.config import (
     DOWNLOADER_POLL_INTERVAL_SECONDS,
     DOWNLOADER_TIMEOUT_SECONDS,
     DOWNLOADER_URL,
+    MAX_SINGLE_FILE_SIZE,
     VIDEO_QUALITY,
 )
+from downloader_bot.infrastructure.http_client import (
+    BACKEND_DOWNLOADER,
+    MEDIA_TRANSFER_TIMEOUT,
+    BackendUnavailableError,
+    HttpClient,
+)
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.infrastructure.streaming import FileTooLargeError, stream_response_to_file
 from downloader_bot.infrastructure.temp_files import cleanup_temp_dir, create_video_temp_dir
 from downloader_bot.models import DownloadResult, VideoInfo
 
@@ -19,28 +27,31 @@ from downloader_bot.models import DownloadResult, VideoInfo
 class YtdlpClient:
     def __init__(
         self,
+        http_client: HttpClient,
         base_url: str = DOWNLOADER_URL,
         timeout_seconds: float = DOWNLOADER_TIMEOUT_SECONDS,
         poll_interval_seconds: float = DOWNLOADER_POLL_INTERVAL_SECONDS,
     ) -> None:
+        self.http_client = http_client
         self.base_url = base_url.rstrip("/")
         self.timeout_seconds = timeout_seconds
         self.poll_interval_seconds = poll_interval_seconds
+        self._cancel_tasks: set[asyncio.Task] = set()
 
     async def get_info(self, url: str) -> dict | None:
         try:
             logging.info("Fallback downloader: POST %s/api/info", self.base_url)
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/api/info", json={"url": url}) as response:
-                    payload = await response.json()
-                    if response.status >= 400:
-                        logging.warning(
-                            "Fallback downloader /api/info HTTP %s: %s",
-                            response.status,
-                            payload.get("error", payload),
-                        )
-                        return None
-                    return payload
+            session = self.http_client.session(BACKEND_DOWNLOADER)
+            async with session.post(f"{self.base_url}/api/info", json={"url": url}) as response:
+                payload = await response.json()
+                if response.status >= 400:
+                    logging.warning(
+                        "Fallback downloader /api/info HTTP %s: %s",
+                        response.status,
+                        payload.get("error", payload),
+                    )
+                    return None
+                return payload
         except Exception as exc:
             logging.error("Fallback downloader info request failed (%s): %s", type(exc).__name__, exc)
             return None
@@ -59,12 +70,14 @@ class YtdlpClient:
             source="downloader",
         )
 
-    async def download(self, url: str) -> DownloadResult | None:
+    async def download(self, url: str, ladder: list[int] | None = None) -> DownloadResult | None:
+        """None when the downloader cannot serve this URL; BackendUnavailableError when the downloader itself fails."""
         video_dir = create_video_temp_dir()
+        job_id = None
         try:
             logging.info("Fallback downloader: starting download for %s", url)
             info = await self.get_info(url) or {}
-            format_id = self._select_format_id(info)
+            format_id = self._select_format_id(info, ladder)
             title = info.get("title", "")
             payload = {
                 "url": url,
@@ -73,36 +86,41 @@ class YtdlpClient:
                 "title": title,
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/api/download", json=payload) as response:
-                    start_payload = await response.json()
-                    if response.status >= 400:
-                        logging.error("Downloader start error: %s", start_payload.get("error", start_payload))
-                        cleanup_temp_dir(video_dir)
-                        return None
-                    job_id = start_payload.get("job_id")
-
-                if not job_id:
-                    logging.error("Downloader did not return a job id")
+            session = self.http_client.session(BACKEND_DOWNLOADER)
+            async with session.post(f"{self.base_url}/api/download", json=payload) as response:
+                if response.status >= 500:
+                    raise BackendUnavailableError(f"downloader /api/download HTTP {response.status}")
+                start_payload = await response.json()
+                if response.status >= 400:
+                    logging.error("Downloader start error: %s", start_payload.get("error", start_payload))
                     cleanup_temp_dir(video_dir)
                     return None
+                job_id = start_payload.get("job_id")
 
-                status = await self._wait_for_job(session, job_id)
-                if not status or status.get("status") != "done":
-                    logging.error("Downloader job failed: %s", status)
+            if not job_id:
+                logging.error("Downloader did not return a job id")
+                cleanup_temp_dir(video_dir)
+                return None
+
+            status = await self._wait_for_job(session, job_id)
+            if not status or status.get("status") != "done":
+                logging.error("Downloader job failed: %s", status)
+                cleanup_temp_dir(video_dir)
+                return None
+
+            filename = status.get("filename") or f"{job_id}.mp4"
+            local_path = os.path.join(video_dir, filename)
+            async with session.get(
+                f"{self.base_url}/api/file/{job_id}",
+                timeout=MEDIA_TRANSFER_TIMEOUT,
+            ) as file_response:
+                if file_response.status >= 500:
+                    raise BackendUnavailableError(f"downloader /api/file HTTP {file_response.status}")
+                if file_response.status != 200:
+                    logging.error("Downloader file error: HTTP %s", file_response.status)
                     cleanup_temp_dir(video_dir)
                     return None
-
-                filename = status.get("filename") or f"{job_id}.mp4"
-                local_path = os.path.join(video_dir, filename)
-                async with session.get(f"{self.base_url}/api/file/{job_id}") as file_response:
-                    if file_response.status != 200:
-                        logging.error("Downloader file error: HTTP %s", file_response.status)
-                        cleanup_temp_dir(video_dir)
-                        return None
-                    async with aiofiles.open(local_path, "wb") as file_obj:
-                        async for chunk in file_response.content.iter_chunked(1024 * 1024):
-                            await file_obj.write(chunk)
+                await stream_response_to_file(file_response, local_path, source="downloader")
 
             if not os.path.exists(local_path) or os.path.getsize(local_path) <= 0:
                 logging.error("Downloader file is empty or missing")
@@ -110,15 +128,47 @@ class YtdlpClient:
                 return None
 
             return DownloadResult(local_path=local_path, filename=filename, temp_dir=video_dir, source="downloader")
+        except FileTooLargeError as exc:
+            logging.error("Downloader fallback aborted for %s: %s", url, exc)
+            cleanup_temp_dir(video_dir)
+            return None
+        except BackendUnavailableError:
+            cleanup_temp_dir(video_dir)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            logging.error("Downloader request failed (%s): %s", type(exc).__name__, exc)
+            cleanup_temp_dir(video_dir)
+            raise BackendUnavailableError(str(exc)) from exc
+        except asyncio.CancelledError:
+            logging.info("Downloader fallback cancelled for %s (job %s)", url, job_id)
+            cleanup_temp_dir(video_dir)
+            if job_id:
+                task = asyncio.create_task(self.cancel_job(job_id))
+                self._cancel_tasks.add(task)
+                task.add_done_callback(self._cancel_tasks.discard)
+            raise
         except Exception as exc:
             logging.error("Error during downloader fallback: %s", exc)
             cleanup_temp_dir(video_dir)
             return None
 
+    async def cancel_job(self, job_id: str) -> None:
+        try:
+            session = self.http_client.session(BACKEND_DOWNLOADER)
+            async with session.post(f"{self.base_url}/api/cancel/{job_id}") as response:
+                if response.status >= 400:
+                    logging.warning("Downloader cancel for job %s: HTTP %s", job_id, response.status)
+                    return
+            logging.info("Cancelled downloader job %s", job_id)
+        except Exception as exc:
+            logging.warning("Downloader cancel request failed for job %s: %s", job_id, exc)
+
     async def _wait_for_job(self, session: aiohttp.ClientSession, job_id: str) -> dict | None:
         deadline = time.monotonic() + self.timeout_seconds
         while time.monotonic() < deadline:
             async with session.get(f"{self.base_url}/api/status/{job_id}") as response:
+                if response.status >= 500:
+                    raise BackendUnavailableError(f"downloader /api/status HTTP {response.status}")
                 payload = await response.json()
                 if response.status >= 400:
                     return payload
@@ -128,12 +178,63 @@ class YtdlpClient:
         return {"status": "error", "error": "Downloader timed out"}
 
     @staticmethod
-    def _select_format_id(info: dict) -> str | None:
+    def _select_format_id(info: dict, ladder: list[int] | None = None) -> str | None:
         formats = info.get("formats") or []
-        target_height = int(VIDEO_QUALITY) if VIDEO_QUALITY.isdigit() else None
         if not formats:
             return None
+        if ladder:
+            return select_ladder_format(formats, ladder, info.get("duration"), info.get("audio"))
+        target_height = int(VIDEO_QUALITY) if VIDEO_QUALITY.isdigit() else None
         if target_height:
             sorted_formats = sorted(formats, key=lambda item: abs((item.get("height") or 0) - target_height))
             return sorted_formats[0].get("id")
         return formats[0].get("id")
+
+
+def estimate_format_size(fmt: dict | None, duration: float | None) -> int | None:
+    """filesize, then filesize_approx, then total bitrate (kbit/s) times duration."""
+    if not fmt:
+        return None
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+    if fmt.get("tbr") and duration:
+        return int(fmt["tbr"] * 1000 / 8 * duration)
+    return None
+
+
+def select_ladder_format(
+    formats: list[dict],
+    ladder: list[int],
+    duration: float | None,
+    audio: dict | None,
+    max_bytes: int = MAX_SINGLE_FILE_SIZE,
+) -> str | None:
+    """Best rung whose predicted video+audio size fits ``max_bytes``; the lowest rung if none does."""
+    audio_size = estimate_format_size(audio, duration) or 0
+    chosen = None
+    for height in ladder:
+        candidates = [fmt for fmt in formats if (fmt.get("height") or 0) <= height]
+        if not candidates:
+            continue
+        chosen = max(candidates, key=lambda item: item.get("height") or 0)
+        video_size = estimate_format_size(chosen, duration)
+        predicted = (video_size + (0 if chosen.get("has_audio") else audio_size)) if video_size else None
+        if predicted is None or predicted <= max_bytes:
+            logging.info(
+                "Selected %sp (format %s), predicted %s",
+                chosen.get("height"),
+                chosen.get("id"),
+                f"{predicted / (1024 * 1024):.2f}MB" if predicted else "unknown size",
+            )
+            return chosen.get("id")
+        logging.info(
+            "Format %s at %sp is predicted at %.2fMB, over the single-upload limit",
+            chosen.get("id"),
+            chosen.get("height"),
+            predicted / (1024 * 1024),
+        )
+        metrics.inc("quality_step_downs", backend="downloader")
+    if chosen is None:
+        chosen = min(formats, key=lambda item: item.get("height") or 0)
+    return chosen.get("id")
@@ -20,19 +20,98 @@ def _parse_int_list(value: str) -> list[int]:
     return result
 
 
+def _parse_str_set(value: str) -> frozenset[str]:
+    return frozenset(item.strip().lower() for item in value.split(",") if item.strip())
+
+
+def _parse_ladder_map(value: str) -> dict[str, list[int]]:
+    result: dict[str, list[int]] = {}
+    for item in value.split(";"):
+        platform, separator, heights = item.partition("=")
+        if separator and platform.strip():
+            result[platform.strip().lower()] = _parse_int_list(heights)
+    return result
+
+
+def _parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Self-hosted telegram-bot-api server (e.g. http://telegram-bot-api:8081); empty uses the cloud Bot API.
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()
+# In --local mode the server reads uploads straight from disk, so files are passed as file:// paths.
+TELEGRAM_API_LOCAL = bool(TELEGRAM_API_URL) and _parse_bool(os.getenv("TELEGRAM_API_LOCAL", "true"))
+TELEGRAM_REQUEST_TIMEOUT_SECONDS = float(
+    os.getenv("TELEGRAM_REQUEST_TIMEOUT_SECONDS", "900" if TELEGRAM_API_LOCAL else "60")
+)
+# Outbound pacing: Telegram allows ~30 msg/s overall, ~1 msg/s per private chat and 20 msg/min per group.
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_PRIVATE_RATE = float(os.getenv("TELEGRAM_PRIVATE_RATE", "1"))
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_FLOOD_RETRIES = int(os.getenv("TELEGRAM_FLOOD_RETRIES", "3"))
 
 COBALT_API_URL = os.getenv("COBALT_API_URL", "http://cobalt-api:9000")
 COBALT_API_KEY = os.getenv("COBALT_API_KEY", "")
 DOWNLOADER_URL = os.getenv("DOWNLOADER_URL", "http://downloader:8899")
 
 VIDEO_QUALITY = os.getenv("VIDEO_QUALITY", "480")
+# Heights tried from best to worst until a rendition is predicted to fit MAX_SINGLE_FILE_SIZE.
+QUALITY_LADDER = _parse_int_list(os.getenv("QUALITY_LADDER", "")) or (
+    [int(VIDEO_QUALITY)] + [height for height in (720, 480, 360) if height < int(VIDEO_QUALITY)]
+    if VIDEO_QUALITY.isdigit()
+    else []
+)
+# Per-platform overrides, e.g. "youtube=720,480,360;tiktok=" (empty disables stepping down).
+QUALITY_LADDER_BY_PLATFORM = _parse_ladder_map(os.getenv("QUALITY_LADDER_BY_PLATFORM", ""))
 SEGMENT_DURATION = int(os.getenv("SEGMENT_DURATION", "120"))
 
-MAX_SINGLE_FILE_SIZE = int(os.getenv("MAX_SINGLE_FILE_SIZE_MB", "45")) * 1024 * 1024
-MAX_TOTAL_FILE_SIZE = int(os.getenv("MAX_TOTAL_FILE_SIZE_MB", "500")) * 1024 * 1024
+# ffmpeg/ffprobe run as asyncio subprocesses; this caps how many run at once.
+FFMPEG_MAX_PROCESSES = int(os.getenv("FFMPEG_MAX_PROCESSES", str(os.cpu_count() or 2)))
+FFMPEG_TIMEOUT_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_SECONDS", "600"))
+
+# The cloud Bot API caps multipart uploads at 50MB; a local server accepts up to 2000MB.
+MAX_SINGLE_FILE_SIZE = int(os.getenv("MAX_SINGLE_FILE_SIZE_MB", "2000" if TELEGRAM_API_LOCAL else "45")) * 1024 * 1024
+MAX_TOTAL_FILE_SIZE = max(int(os.getenv("MAX_TOTAL_FILE_SIZE_MB", "500")) * 1024 * 1024, MAX_SINGLE_FILE_SIZE)
+# "size" cuts at keyframes so every part fits MAX_SINGLE_FILE_SIZE; "duration" is the legacy even split.
+SPLIT_MODE = os.getenv("SPLIT_MODE", "size").strip().lower()
+# Share of MAX_SINGLE_FILE_SIZE planned for media packets; the rest is left for container overhead.
+SPLIT_SIZE_HEADROOM = float(os.getenv("SPLIT_SIZE_HEADROOM", "0.97"))
+SPLIT_MAX_RESPLIT_DEPTH = int(os.getenv("SPLIT_MAX_RESPLIT_DEPTH", "2"))
+# Parts cut ahead of the uploader; bounds the disk used by finished-but-unsent parts.
+SPLIT_LOOKAHEAD_PARTS = int(os.getenv("SPLIT_LOOKAHEAD_PARTS", "2"))
+# sequential: one part after another; parallel: concurrent uploads to a staging chat, then re-sent in order
+# by file_id; album: like parallel, but re-sent as media groups of up to 10.
+PART_UPLOAD_MODE = os.getenv("PART_UPLOAD_MODE", "sequential").strip().lower()
+# Upper bound for concurrent part uploads; halved on flood-wait, grown back gradually.
+PART_UPLOAD_CONCURRENCY = int(os.getenv("PART_UPLOAD_CONCURRENCY", "3"))
+# Re-encode videos over MAX_SINGLE_FILE_SIZE with x264 (CPU only) to fit it instead of splitting.
+FIT_TRANSCODE = _parse_bool(os.getenv("FIT_TRANSCODE", "false"))
+# Transcode only if the predicted encode time is below this; otherwise split.
+FIT_TRANSCODE_MAX_SECONDS = float(os.getenv("FIT_TRANSCODE_MAX_SECONDS", "180"))
+# Initial guess of media seconds encoded per wall-clock second; refined from finished encodes.
+FIT_TRANSCODE_SPEED = float(os.getenv("FIT_TRANSCODE_SPEED", "3"))
+# x264 threads per encode (the CPU share given to transcoding) and encodes allowed at once.
+FIT_TRANSCODE_THREADS = int(os.getenv("FIT_TRANSCODE_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+FIT_TRANSCODE_CONCURRENCY = int(os.getenv("FIT_TRANSCODE_CONCURRENCY", "1"))
+FIT_TRANSCODE_PRESET = os.getenv("FIT_TRANSCODE_PRESET", "veryfast")
+FIT_AUDIO_BITRATE_KBPS = int(os.getenv("FIT_AUDIO_BITRATE_KBPS", "96"))
+# Below this video bitrate the result would look worse than splitting.
+FIT_MIN_VIDEO_BITRATE_KBPS = int(os.getenv("FIT_MIN_VIDEO_BITRATE_KBPS", "300"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE_KB", "1024")) * 1024
+# Parallel byte-range downloads for cobalt "redirect" URLs (1 disables).
+RANGED_DOWNLOAD_CONNECTIONS = int(os.getenv("RANGED_DOWNLOAD_CONNECTIONS", "4"))
+RANGED_MIN_SEGMENT_SIZE = int(os.getenv("RANGED_MIN_SEGMENT_MB", "4")) * 1024 * 1024
+RANGED_SEGMENT_RETRIES = int(os.getenv("RANGED_SEGMENT_RETRIES", "3"))
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+# Telegram file_id cache: repeated links are answered without downloading.
+FILE_ID_CACHE_PATH = Path(os.getenv("FILE_ID_CACHE_PATH", str(DATA_DIR / "file_id_cache.sqlite3")))
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", "5000"))
+FILE_ID_CACHE_TTL_SECONDS = int(os.getenv("FILE_ID_CACHE_TTL_DAYS", "30")) * 24 * 3600
+# Relays awaiting an answer from the business bot, so they survive restarts.
+RELAY_LEDGER_PATH = Path(os.getenv("RELAY_LEDGER_PATH", str(DATA_DIR / "relay_ledger.sqlite3")))
 COOKIES_SAVE_PATH = os.getenv("COOKIES_SAVE_PATH", "/root/cobalt/cookies.json")
 COOKIE_UPDATE_INTERVAL_HOURS = int(os.getenv("COOKIE_UPDATE_INTERVAL_HOURS", "12"))
 
@@ -41,10 +120,61 @@ RESTRICTED_THREADS = _parse_int_list(os.getenv("RESTRICTED_THREADS", "8740"))
 DOWNLOADER_POLL_INTERVAL_SECONDS = float(os.getenv("DOWNLOADER_POLL_INTERVAL_SECONDS", "2"))
 DOWNLOADER_TIMEOUT_SECONDS = float(os.getenv("DOWNLOADER_TIMEOUT_SECONDS", "300"))
 
+# Hedged backend resolution: start yt-dlp if cobalt has not started transferring the file after the delay.
+DOWNLOAD_HEDGING = _parse_bool(os.getenv("DOWNLOAD_HEDGING", "true"))
+DOWNLOAD_HEDGE_DELAY_SECONDS = float(os.getenv("DOWNLOAD_HEDGE_DELAY_SECONDS", "20"))
+INFO_HEDGE_DELAY_SECONDS = float(os.getenv("INFO_HEDGE_DELAY_SECONDS", "3"))
+# Platforms where cobalt is known to be weak: both backends start at once.
+HEDGE_IMMEDIATE_PLATFORMS = _parse_str_set(os.getenv("HEDGE_IMMEDIATE_PLATFORMS", "instagram"))
+
+# Adaptive backend order per platform: sliding window of outcomes plus a circuit breaker.
+ROUTER_WINDOW_SIZE = int(os.getenv("ROUTER_WINDOW_SIZE", "50"))
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "3600"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "3"))
+ROUTER_BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+ROUTER_BREAKER_OPEN_SECONDS = float(os.getenv("ROUTER_BREAKER_OPEN_SECONDS", "120"))
+
+# JSON stats endpoint (GET /metrics) inside the container; 0 disables it.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8897"))
+
+# Shared outbound HTTP layer: one keep-alive pool per backend, cached DNS.
+HTTP_DNS_CACHE_TTL_SECONDS = int(os.getenv("HTTP_DNS_CACHE_TTL_SECONDS", "300"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+COBALT_HTTP_TIMEOUT_SECONDS = float(os.getenv("COBALT_HTTP_TIMEOUT_SECONDS", "60"))
+COBALT_HTTP_MAX_CONNECTIONS = int(os.getenv("COBALT_HTTP_MAX_CONNECTIONS", "20"))
+DOWNLOADER_HTTP_TIMEOUT_SECONDS = float(os.getenv("DOWNLOADER_HTTP_TIMEOUT_SECONDS", "60"))
+DOWNLOADER_HTTP_MAX_CONNECTIONS = int(os.getenv("DOWNLOADER_HTTP_MAX_CONNECTIONS", "10"))
+BUSINESS_HTTP_TIMEOUT_SECONDS = float(os.getenv("BUSINESS_HTTP_TIMEOUT_SECONDS", "30"))
+MEDIA_HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("MEDIA_HTTP_READ_TIMEOUT_SECONDS", "60"))
+MEDIA_HTTP_MAX_CONNECTIONS = int(os.getenv("MEDIA_HTTP_MAX_CONNECTIONS", "32"))
+
 YTDLP_COOKIES_FILE = os.getenv("YTDLP_COOKIES_FILE", "")
 
+# Admission control for link jobs (relay wait, local fallback and upload included).
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", "6"))
+JOB_MAX_PER_CHAT = int(os.getenv("JOB_MAX_PER_CHAT", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "30"))
+# Start each user's shortest waiting video first when it is their turn (duration from /api/info).
+JOB_SHORTEST_FIRST = _parse_bool(os.getenv("JOB_SHORTEST_FIRST", "false"))
+
 RELAY_TIMEOUT_SECONDS = int(os.getenv("RELAY_TIMEOUT_SECONDS", "120"))
+# Once a platform has RELAY_TIMEOUT_MIN_SAMPLES relay latencies, its timeout is that percentile times the margin,
+# clamped to [RELAY_TIMEOUT_MIN_SECONDS, RELAY_TIMEOUT_MAX_SECONDS]; until then RELAY_TIMEOUT_SECONDS applies.
+RELAY_TIMEOUT_PERCENTILE = float(os.getenv("RELAY_TIMEOUT_PERCENTILE", "0.95"))
+RELAY_TIMEOUT_MARGIN = float(os.getenv("RELAY_TIMEOUT_MARGIN", "1.25"))
+RELAY_TIMEOUT_MIN_SECONDS = float(os.getenv("RELAY_TIMEOUT_MIN_SECONDS", "20"))
+RELAY_TIMEOUT_MAX_SECONDS = float(os.getenv("RELAY_TIMEOUT_MAX_SECONDS", "180"))
+RELAY_TIMEOUT_MIN_SAMPLES = int(os.getenv("RELAY_TIMEOUT_MIN_SAMPLES", "10"))
+RELAY_LATENCY_WINDOW = int(os.getenv("RELAY_LATENCY_WINDOW", "200"))
+# Start the local download at the median relay latency so a timed-out relay falls back to a warm download.
+RELAY_SPECULATIVE_DOWNLOAD = _parse_bool(os.getenv("RELAY_SPECULATIVE_DOWNLOAD", "false"))
+# Platforms where the relay and a local download race from the start; the first result is delivered.
+RELAY_RACE_PLATFORMS = _parse_str_set(os.getenv("RELAY_RACE_PLATFORMS", ""))
 RELAY_OWNER_USER_ID = int(os.getenv("RELAY_OWNER_USER_ID", "0"))
+# Fetch each relayed link's duration from /api/info so untagged relay videos can still be matched by length.
+RELAY_DURATION_HINTS = _parse_bool(os.getenv("RELAY_DURATION_HINTS", "false"))
+# Chat the parallel/album part uploads go to before being re-sent in order; 0 disables staging (sequential upload).
+PART_UPLOAD_STAGING_CHAT_ID = int(os.getenv("PART_UPLOAD_STAGING_CHAT_ID", "0"))
 # Main bot responds only in this group (e.g. -1002185211541) and owner private chat.
 ALLOWED_GROUP_ID = int(os.getenv("ALLOWED_GROUP_ID", "0"))
 BUSINESS_BOT_URL = os.getenv("BUSINESS_BOT_URL", "http://business-bot:8898")
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+
+
+class AimdLimiter:
+    """Concurrency limit with additive increase on success and multiplicative decrease on back-pressure."""
+
+    def __init__(self, max_limit: int, name: str, min_limit: int = 1) -> None:
+        self.max_limit = max(min_limit, max_limit)
+        self.min_limit = min_limit
+        self.name = name
+        self.limit = float(self.max_limit)
+        self._in_use = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_use < int(self.limit))
+            self._in_use += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release()
+
+    def on_success(self) -> None:
+        # Roughly +1 per window of `limit` successes.
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def on_backoff(self) -> None:
+        previous = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        if int(self.limit) != previous:
+            logging.warning("%s concurrency reduced to %s", self.name, int(self.limit))
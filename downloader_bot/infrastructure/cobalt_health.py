@@ -3,9 +3,10 @@ import logging
 import aiohttp
 
 from downloader_bot.config import COBALT_API_KEY, COBALT_API_URL, VIDEO_QUALITY
+from downloader_bot.infrastructure.http_client import BACKEND_COBALT, HttpClient
 
 
-async def check_cobalt_reachable() -> tuple[bool, str]:
+async def check_cobalt_reachable(http_client: HttpClient) -> tuple[bool, str]:
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
@@ -21,12 +22,12 @@ async def check_cobalt_reachable() -> tuple[bool, str]:
 
     try:
         timeout = aiohttp.ClientTimeout(total=15)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(COBALT_API_URL, json=payload, headers=headers) as response:
-                body = await response.text()
-                if response.status >= 500:
-                    return False, f"HTTP {response.status}: {body[:200]}"
-                return True, f"HTTP {response.status}: {body[:200]}"
+        session = http_client.session(BACKEND_COBALT)
+        async with session.post(COBALT_API_URL, json=payload, headers=headers, timeout=timeout) as response:
+            body = await response.text()
+            if response.status >= 500:
+                return False, f"HTTP {response.status}: {body[:200]}"
+            return True, f"HTTP {response.status}: {body[:200]}"
     except aiohttp.ClientConnectorError as exc:
         return False, f"connection error ({type(exc).__name__}): {exc}"
     except TimeoutError:
@@ -0,0 +1,112 @@
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from downloader_bot.canonical_url import canonicalize_url
+from downloader_bot.config import (
+    FILE_ID_CACHE_MAX_ENTRIES,
+    FILE_ID_CACHE_PATH,
+    FILE_ID_CACHE_TTL_SECONDS,
+    VIDEO_QUALITY,
+)
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.models import CachedMedia
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(url: str, quality: str = VIDEO_QUALITY) -> str:
+    canonical = canonicalize_url(url)
+    base = canonical.key if canonical else url.strip().split("#", 1)[0]
+    return f"{base}|{quality}"
+
+
+class FileIdCache:
+    """Source URL → Telegram file_ids of every delivered part, with LRU and TTL eviction."""
+
+    def __init__(
+        self,
+        path: Path = FILE_ID_CACHE_PATH,
+        max_entries: int = FILE_ID_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = FILE_ID_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_ids (
+                cache_key TEXT PRIMARY KEY,
+                parts TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> list[CachedMedia] | None:
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT parts, created_at FROM file_ids WHERE cache_key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            metrics.inc("file_id_cache_misses")
+            return None
+
+        parts_json, created_at = row
+        if self.ttl_seconds and now - created_at > self.ttl_seconds:
+            self.invalidate(key)
+            metrics.inc("file_id_cache_misses")
+            return None
+
+        with self._conn:
+            self._conn.execute("UPDATE file_ids SET last_used_at = ? WHERE cache_key = ?", (now, key))
+        metrics.inc("file_id_cache_hits")
+        return [CachedMedia(kind=item["kind"], file_id=item["file_id"]) for item in json.loads(parts_json)]
+
+    def put(self, key: str, parts: list[CachedMedia]) -> None:
+        if not parts:
+            return
+        now = time.time()
+        parts_json = json.dumps([{"kind": part.kind, "file_id": part.file_id} for part in parts])
+        with self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO file_ids (cache_key, parts, created_at, last_used_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    parts = excluded.parts,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+                """,
+                (key, parts_json, now, now),
+            )
+            self._evict(now)
+        logger.info("Cached %s file_id(s) for %s", len(parts), key)
+
+    def invalidate(self, key: str) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM file_ids WHERE cache_key = ?", (key,))
+        logger.info("Invalidated cached file_ids for %s", key)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM file_ids WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                """
+                DELETE FROM file_ids WHERE cache_key IN (
+                    SELECT cache_key FROM file_ids ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
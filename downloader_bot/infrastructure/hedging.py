@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Sequence
+from contextvars import ContextVar
+from typing import TypeVar
+
+from downloader_bot.infrastructure.metrics import metrics
+
+T = TypeVar("T")
+
+Candidate = tuple[str, Callable[[], Awaitable[T | None]]]
+
+_progress: ContextVar[asyncio.Event | None] = ContextVar("hedge_progress", default=None)
+
+
+def report_progress() -> None:
+    """Mark the current hedged candidate as transferring, so its hedge timer no longer starts the next one."""
+    event = _progress.get()
+    if event is not None:
+        event.set()
+
+
+def _result_of(task: asyncio.Task) -> object | None:
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+
+async def hedged_first(
+    candidates: Sequence[Candidate],
+    delays: Sequence[float | None],
+    is_valid: Callable[[T], bool] = lambda _result: True,
+    discard: Callable[[T], None] | None = None,
+    operation: str = "request",
+) -> T | None:
+    """Start candidates one after another and return the first valid result.
+
+    ``delays[i]`` is how long candidate ``i`` gets before candidate ``i + 1`` is started
+    anyway (None waits for it to finish); a candidate that fails starts the next one immediately. A candidate
+    that has called ``report_progress`` is not hedged on its timer any more, only on failure. Losers are
+    cancelled, and valid results that lose the race are passed to ``discard``.
+    """
+    tasks: dict[asyncio.Task, str] = {}
+    progress: dict[asyncio.Task, asyncio.Event] = {}
+    next_index = 0
+    transferring = False
+
+    def start_next() -> None:
+        nonlocal next_index
+        name, factory = candidates[next_index]
+        next_index += 1
+        event = asyncio.Event()
+        token = _progress.set(event)
+        try:
+            task = asyncio.ensure_future(factory())
+        finally:
+            _progress.reset(token)
+        tasks[task] = name
+        progress[task] = event
+        if len(tasks) > 1:
+            logging.info("Hedging %s: started %s", operation, name)
+
+    async def settle(winner: asyncio.Task | None) -> None:
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        if losers:
+            await asyncio.gather(*losers, return_exceptions=True)
+        for task in losers:
+            result = _result_of(task)
+            if result is not None and discard:
+                discard(result)
+
+    start_next()
+    try:
+        while True:
+            running = {task for task in tasks if not task.done()}
+            timeout = None
+            if next_index < len(candidates) and not transferring:
+                timeout = delays[next_index - 1] if next_index - 1 < len(delays) else None
+            if running:
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                done = set()
+
+            for task in done:
+                result = _result_of(task)
+                if result is not None and is_valid(result):
+                    name = tasks[task]
+                    metrics.inc("hedge_wins", operation=operation, backend=name)
+                    if len(tasks) > 1:
+                        logging.info("Hedged %s won by %s", operation, name)
+                    await settle(task)
+                    return result
+                if result is not None and discard:
+                    discard(result)
+
+            if not done and any(progress[task].is_set() for task in running):
+                if not transferring:
+                    metrics.inc("hedges_skipped", operation=operation)
+                    logging.info("Not hedging %s: %s is already transferring", operation, tasks[next(iter(running))])
+                transferring = True
+                continue
+            transferring = False
+            if next_index < len(candidates):
+                start_next()
+            elif all(task.done() for task in tasks):
+                return None
+    except asyncio.CancelledError:
+        await settle(None)
+        raise
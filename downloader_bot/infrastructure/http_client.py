@@ -0,0 +1,113 @@
+import logging
+from dataclasses import dataclass
+
+import aiohttp
+
+from downloader_bot.config import (
+    BUSINESS_HTTP_TIMEOUT_SECONDS,
+    COBALT_HTTP_MAX_CONNECTIONS,
+    COBALT_HTTP_TIMEOUT_SECONDS,
+    DOWNLOADER_HTTP_MAX_CONNECTIONS,
+    DOWNLOADER_HTTP_TIMEOUT_SECONDS,
+    HTTP_DNS_CACHE_TTL_SECONDS,
+    HTTP_KEEPALIVE_SECONDS,
+    MEDIA_HTTP_MAX_CONNECTIONS,
+    MEDIA_HTTP_READ_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKEND_COBALT = "cobalt"
+BACKEND_DOWNLOADER = "downloader"
+BACKEND_BUSINESS = "business"
+BACKEND_TELEGRAPH = "telegraph"
+# Large file transfers (cobalt tunnels, CDN redirects): no total deadline, only idle reads.
+BACKEND_MEDIA = "media"
+
+# Per-request timeout for file bodies served by API backends (e.g. /api/file/<job>).
+MEDIA_TRANSFER_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=MEDIA_HTTP_READ_TIMEOUT_SECONDS)
+
+
+class BackendUnavailableError(Exception):
+    """The backend itself failed (transport error or HTTP 5xx), as opposed to refusing or failing one request."""
+
+
+@dataclass(frozen=True)
+class BackendLimits:
+    timeout: aiohttp.ClientTimeout
+    max_connections: int
+    max_connections_per_host: int
+
+
+def default_backend_limits() -> dict[str, BackendLimits]:
+    return {
+        BACKEND_COBALT: BackendLimits(
+            timeout=aiohttp.ClientTimeout(total=COBALT_HTTP_TIMEOUT_SECONDS, sock_connect=10),
+            max_connections=COBALT_HTTP_MAX_CONNECTIONS,
+            max_connections_per_host=COBALT_HTTP_MAX_CONNECTIONS,
+        ),
+        BACKEND_DOWNLOADER: BackendLimits(
+            timeout=aiohttp.ClientTimeout(total=DOWNLOADER_HTTP_TIMEOUT_SECONDS, sock_connect=10),
+            max_connections=DOWNLOADER_HTTP_MAX_CONNECTIONS,
+            max_connections_per_host=DOWNLOADER_HTTP_MAX_CONNECTIONS,
+        ),
+        BACKEND_BUSINESS: BackendLimits(
+            timeout=aiohttp.ClientTimeout(total=BUSINESS_HTTP_TIMEOUT_SECONDS, sock_connect=10),
+            max_connections=4,
+            max_connections_per_host=4,
+        ),
+        BACKEND_TELEGRAPH: BackendLimits(
+            timeout=aiohttp.ClientTimeout(total=30, sock_connect=10),
+            max_connections=4,
+            max_connections_per_host=4,
+        ),
+        BACKEND_MEDIA: BackendLimits(
+            timeout=MEDIA_TRANSFER_TIMEOUT,
+            max_connections=MEDIA_HTTP_MAX_CONNECTIONS,
+            max_connections_per_host=max(1, MEDIA_HTTP_MAX_CONNECTIONS // 2),
+        ),
+    }
+
+
+class HttpClient:
+    """Application-scoped aiohttp sessions, one keep-alive pool per backend."""
+
+    def __init__(self, limits: dict[str, BackendLimits] | None = None) -> None:
+        self._limits = limits or default_backend_limits()
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        self._closed = False
+
+    def session(self, backend: str) -> aiohttp.ClientSession:
+        if self._closed:
+            raise RuntimeError("HttpClient is closed")
+        session = self._sessions.get(backend)
+        if session is None or session.closed:
+            session = self._create_session(backend)
+            self._sessions[backend] = session
+        return session
+
+    def _create_session(self, backend: str) -> aiohttp.ClientSession:
+        limits = self._limits.get(backend) or self._limits[BACKEND_MEDIA]
+        connector = aiohttp.TCPConnector(
+            limit=limits.max_connections,
+            limit_per_host=limits.max_connections_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        logger.info(
+            "HTTP pool created backend=%s limit=%s per_host=%s",
+            backend,
+            limits.max_connections,
+            limits.max_connections_per_host,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=limits.timeout)
+
+    async def close(self) -> None:
+        self._closed = True
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        logger.info("HTTP pools closed")
@@ -0,0 +1,40 @@
+import logging
+from collections.abc import Callable
+
+from aiohttp import web
+
+from downloader_bot.infrastructure.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+StatsProvider = Callable[[], dict]
+
+
+def create_metrics_app(providers: dict[str, StatsProvider]) -> web.Application:
+    app = web.Application()
+
+    async def health(_request: web.Request) -> web.Response:
+        return web.json_response({"ok": True})
+
+    async def metrics_view(_request: web.Request) -> web.Response:
+        payload: dict[str, object] = {"metrics": metrics.snapshot()}
+        for name, provider in providers.items():
+            try:
+                payload[name] = provider()
+            except Exception as exc:
+                logger.exception("Stats provider %s failed: %s", name, exc)
+                payload[name] = {"error": str(exc)}
+        return web.json_response(payload)
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_view)
+    return app
+
+
+async def start_metrics_server(providers: dict[str, StatsProvider], port: int) -> web.AppRunner:
+    runner = web.AppRunner(create_metrics_app(providers))
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=port)
+    await site.start()
+    logger.info("Metrics endpoint on 0.0.0.0:%s/metrics", port)
+    return runner
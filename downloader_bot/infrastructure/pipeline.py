@@ -0,0 +1,42 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def prefetch(source: AsyncIterator[T], lookahead: int) -> AsyncIterator[T]:
+    """Drive ``source`` in a background task, at most ``lookahead`` items ahead of the consumer.
+
+    Errors raised by ``source`` surface at the consumer in order; closing the consumer cancels the producer.
+    """
+    queue: asyncio.Queue[tuple[object, BaseException | None]] = asyncio.Queue(maxsize=max(1, lookahead))
+
+    async def produce() -> None:
+        try:
+            async for item in source:
+                await queue.put((item, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await queue.put((_DONE, exc))
+            return
+        await queue.put((_DONE, None))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
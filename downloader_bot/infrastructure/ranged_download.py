@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from dataclasses import dataclass
+
+import aiofiles
+import aiohttp
+
+from downloader_bot.config import (
+    DOWNLOAD_CHUNK_SIZE,
+    MAX_TOTAL_FILE_SIZE,
+    RANGED_DOWNLOAD_CONNECTIONS,
+    RANGED_MIN_SEGMENT_SIZE,
+    RANGED_SEGMENT_RETRIES,
+)
+from downloader_bot.infrastructure.hedging import report_progress
+from downloader_bot.infrastructure.streaming import FileTooLargeError, record_transfer
+from downloader_bot.models import TransferStats
+
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+class RangeDownloadError(Exception):
+    pass
+
+
+@dataclass
+class ByteRange:
+    start: int
+    end: int
+    written: int = 0
+
+    @property
+    def next_offset(self) -> int:
+        return self.start + self.written
+
+    @property
+    def done(self) -> bool:
+        return self.next_offset > self.end
+
+
+def plan_ranges(total_size: int, connections: int, min_segment_size: int) -> list[ByteRange]:
+    segment_count = max(1, min(connections, math.ceil(total_size / max(1, min_segment_size))))
+    segment_size = math.ceil(total_size / segment_count)
+    ranges = []
+    for start in range(0, total_size, segment_size):
+        ranges.append(ByteRange(start=start, end=min(total_size, start + segment_size) - 1))
+    return ranges
+
+
+async def probe_range_support(session: aiohttp.ClientSession, url: str) -> int | None:
+    """Return the full size when the server honours byte ranges, otherwise None."""
+    async with session.get(url, headers={"Range": "bytes=0-0"}) as response:
+        if response.status != 206:
+            return None
+        match = _CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+        if not match or match.group(3) == "*":
+            return None
+        await response.read()
+        return int(match.group(3))
+
+
+class _BufferTracker:
+    def __init__(self) -> None:
+        self.current = 0
+        self.peak = 0
+
+    def add(self, size: int) -> None:
+        self.current += size
+        self.peak = max(self.peak, self.current)
+
+    def release(self, size: int) -> None:
+        self.current -= size
+
+
+async def _fetch_range(
+    session: aiohttp.ClientSession,
+    url: str,
+    local_path: str,
+    byte_range: ByteRange,
+    buffers: _BufferTracker,
+    chunk_size: int,
+) -> None:
+    headers = {"Range": f"bytes={byte_range.next_offset}-{byte_range.end}"}
+    async with session.get(url, headers=headers) as response:
+        if response.status != 206:
+            raise RangeDownloadError(f"expected HTTP 206 for {headers['Range']}, got {response.status}")
+        match = _CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+        if not match or int(match.group(1)) != byte_range.next_offset:
+            raise RangeDownloadError(f"unexpected Content-Range for {headers['Range']}")
+
+        async with aiofiles.open(local_path, "r+b") as file_obj:
+            await file_obj.seek(byte_range.next_offset)
+            async for chunk in response.content.iter_chunked(chunk_size):
+                remaining = byte_range.end - byte_range.next_offset + 1
+                chunk = chunk[:remaining]
+                report_progress()
+                buffers.add(len(chunk))
+                try:
+                    await file_obj.write(chunk)
+                finally:
+                    buffers.release(len(chunk))
+                byte_range.written += len(chunk)
+                if byte_range.done:
+                    break
+
+    if not byte_range.done:
+        raise RangeDownloadError(f"range {byte_range.start}-{byte_range.end} ended early at {byte_range.next_offset}")
+
+
+async def _fetch_range_with_resume(
+    session: aiohttp.ClientSession,
+    url: str,
+    local_path: str,
+    byte_range: ByteRange,
+    buffers: _BufferTracker,
+    semaphore: asyncio.Semaphore,
+    retries: int,
+    chunk_size: int,
+) -> None:
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                await _fetch_range(session, url, local_path, byte_range, buffers, chunk_size)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError, RangeDownloadError) as exc:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logging.warning(
+                "Range %s-%s failed at offset %s (%s), resuming (attempt %s/%s)",
+                byte_range.start,
+                byte_range.end,
+                byte_range.next_offset,
+                exc,
+                attempt,
+                retries,
+            )
+            await asyncio.sleep(min(2.0, 0.25 * attempt))
+
+
+async def download_ranged(
+    session: aiohttp.ClientSession,
+    url: str,
+    local_path: str,
+    source: str,
+    connections: int = RANGED_DOWNLOAD_CONNECTIONS,
+    min_segment_size: int = RANGED_MIN_SEGMENT_SIZE,
+    retries: int = RANGED_SEGMENT_RETRIES,
+    max_bytes: int = MAX_TOTAL_FILE_SIZE,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+) -> TransferStats | None:
+    """Fetch ``url`` over parallel byte ranges; None means ranges are unsupported or not worth it."""
+    total_size = await probe_range_support(session, url)
+    if not total_size:
+        return None
+    if max_bytes and total_size > max_bytes:
+        raise FileTooLargeError(total_size, max_bytes)
+
+    ranges = plan_ranges(total_size, connections, min_segment_size)
+    if len(ranges) < 2:
+        return None
+
+    started = time.monotonic()
+    async with aiofiles.open(local_path, "wb") as file_obj:
+        await file_obj.truncate(total_size)
+
+    buffers = _BufferTracker()
+    semaphore = asyncio.Semaphore(connections)
+    logging.info(
+        "Ranged download of %.2fMB over %s ranges (%s connections)",
+        total_size / (1024 * 1024),
+        len(ranges),
+        connections,
+    )
+    tasks = [
+        asyncio.create_task(
+            _fetch_range_with_resume(session, url, local_path, byte_range, buffers, semaphore, retries, chunk_size)
+        )
+        for byte_range in ranges
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    stats = TransferStats(
+        bytes_written=sum(byte_range.written for byte_range in ranges),
+        elapsed_seconds=time.monotonic() - started,
+        peak_buffer_bytes=buffers.peak,
+    )
+    record_transfer(stats, f"{source}_ranged")
+    return stats
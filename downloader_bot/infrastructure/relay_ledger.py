@@ -0,0 +1,158 @@
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from downloader_bot.config import RELAY_LEDGER_PATH
+from downloader_bot.models import DeliveryTarget
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RelayRecord:
+    target: DeliveryTarget
+    url: str
+    user_mention: str
+    processing_message_id: int
+    relay_message_id: int | None
+    created_at: float
+    # Wall-clock time, so deadlines stay meaningful across restarts.
+    deadline: float
+    ledger_id: int | None = None
+
+
+class RelayLedger:
+    """Unanswered relays and recent relay latencies, persisted so a restart loses neither."""
+
+    def __init__(self, path: Path = RELAY_LEDGER_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS relays (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                thread_id INTEGER,
+                message_id INTEGER NOT NULL,
+                chat_type TEXT NOT NULL,
+                processing_message_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                user_mention TEXT NOT NULL,
+                relay_message_id INTEGER,
+                created_at REAL NOT NULL,
+                deadline REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS relay_latency (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                platform TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                observed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS relay_latency_platform ON relay_latency (platform, id)")
+        self._conn.commit()
+
+    def add(self, record: RelayRecord) -> int:
+        target = record.target
+        with self._conn:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO relays (
+                    chat_id, thread_id, message_id, chat_type, processing_message_id,
+                    url, user_mention, relay_message_id, created_at, deadline
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    target.chat_id,
+                    target.thread_id,
+                    target.message_id,
+                    target.chat_type,
+                    record.processing_message_id,
+                    record.url,
+                    record.user_mention,
+                    record.relay_message_id,
+                    record.created_at,
+                    record.deadline,
+                ),
+            )
+        return cursor.lastrowid
+
+    def remove(self, ledger_id: int | None) -> None:
+        if ledger_id is None:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM relays WHERE id = ?", (ledger_id,))
+
+    def load(self) -> list[RelayRecord]:
+        rows = self._conn.execute(
+            """
+            SELECT id, chat_id, thread_id, message_id, chat_type, processing_message_id,
+                   url, user_mention, relay_message_id, created_at, deadline
+            FROM relays ORDER BY id
+            """
+        ).fetchall()
+        records = [
+            RelayRecord(
+                target=DeliveryTarget(
+                    chat_id=chat_id,
+                    thread_id=thread_id,
+                    message_id=message_id,
+                    chat_type=chat_type,
+                ),
+                url=url,
+                user_mention=user_mention,
+                processing_message_id=processing_message_id,
+                relay_message_id=relay_message_id,
+                created_at=created_at,
+                deadline=deadline,
+                ledger_id=ledger_id,
+            )
+            for (
+                ledger_id,
+                chat_id,
+                thread_id,
+                message_id,
+                chat_type,
+                processing_message_id,
+                url,
+                user_mention,
+                relay_message_id,
+                created_at,
+                deadline,
+            ) in rows
+        ]
+        if records:
+            logger.info("Loaded %s pending relay(s) from %s", len(records), RELAY_LEDGER_PATH)
+        return records
+
+    def add_latency(self, platform: str, seconds: float, window: int) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO relay_latency (platform, seconds, observed_at) VALUES (?, ?, ?)",
+                (platform, seconds, time.time()),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM relay_latency WHERE platform = ? AND id NOT IN (
+                    SELECT id FROM relay_latency WHERE platform = ? ORDER BY id DESC LIMIT ?
+                )
+                """,
+                (platform, platform, window),
+            )
+
+    def load_latencies(self) -> dict[str, list[float]]:
+        latencies: dict[str, list[float]] = {}
+        for platform, seconds in self._conn.execute("SELECT platform, seconds FROM relay_latency ORDER BY id"):
+            latencies.setdefault(platform, []).append(seconds)
+        return latencies
+
+    def close(self) -> None:
+        self._conn.close()
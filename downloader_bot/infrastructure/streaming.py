@@ -0,0 +1,76 @@
+import logging
+import time
+
+import aiofiles
+import aiohttp
+
+from downloader_bot.config import DOWNLOAD_CHUNK_SIZE, MAX_TOTAL_FILE_SIZE
+from downloader_bot.infrastructure.hedging import report_progress
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.models import TransferStats
+
+
+class FileTooLargeError(Exception):
+    def __init__(self, size: int, limit: int) -> None:
+        super().__init__(f"file is {size / (1024 * 1024):.2f}MB, limit is {limit / (1024 * 1024):.2f}MB")
+        self.size = size
+        self.limit = limit
+
+
+def predicted_size(response: aiohttp.ClientResponse) -> int | None:
+    """Content-Length, or cobalt's Estimated-Content-Length for tunnelled (remuxed) streams."""
+    if response.content_length is not None:
+        return response.content_length
+    estimated = response.headers.get("Estimated-Content-Length")
+    return int(estimated) if estimated and estimated.isdigit() else None
+
+
+def check_content_length(response: aiohttp.ClientResponse, max_bytes: int = MAX_TOTAL_FILE_SIZE) -> None:
+    content_length = response.content_length
+    if max_bytes and content_length is not None and content_length > max_bytes:
+        raise FileTooLargeError(content_length, max_bytes)
+
+
+async def stream_response_to_file(
+    response: aiohttp.ClientResponse,
+    local_path: str,
+    source: str,
+    max_bytes: int = MAX_TOTAL_FILE_SIZE,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+) -> TransferStats:
+    check_content_length(response, max_bytes)
+
+    started = time.monotonic()
+    written = 0
+    peak_buffer = 0
+    async with aiofiles.open(local_path, "wb") as file_obj:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            if not written:
+                report_progress()
+            written += len(chunk)
+            peak_buffer = max(peak_buffer, len(chunk))
+            if max_bytes and written > max_bytes:
+                raise FileTooLargeError(written, max_bytes)
+            await file_obj.write(chunk)
+
+    stats = TransferStats(
+        bytes_written=written,
+        elapsed_seconds=time.monotonic() - started,
+        peak_buffer_bytes=peak_buffer,
+    )
+    record_transfer(stats, source)
+    return stats
+
+
+def record_transfer(stats: TransferStats, source: str) -> None:
+    metrics.observe("download_bytes_per_second", stats.bytes_per_second, source=source)
+    metrics.observe("download_peak_buffer_bytes", stats.peak_buffer_bytes, source=source)
+    metrics.inc("download_bytes_total", stats.bytes_written, source=source)
+    logging.info(
+        "Streamed %.2fMB from %s in %.1fs (%.2fMB/s, peak buffer %.0fKB)",
+        stats.bytes_written / (1024 * 1024),
+        source,
+        stats.elapsed_seconds,
+        stats.bytes_per_second / (1024 * 1024),
+        stats.peak_buffer_bytes / 1024,
+    )
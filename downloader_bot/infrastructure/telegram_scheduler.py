@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    DeleteMessage,
+    DeleteMessages,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    Response,
+    SendChatAction,
+    SendDocument,
+    SendMediaGroup,
+    SendVideo,
+    TelegramMethod,
+)
+from aiogram.methods.base import TelegramType
+
+from downloader_bot.config import (
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_FLOOD_RETRIES,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_PRIVATE_RATE,
+)
+from downloader_bot.infrastructure.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_DELIVERY = 0
+PRIORITY_HOUSEKEEPING = 1
+
+_PRIORITY_NAMES = {PRIORITY_DELIVERY: "delivery", PRIORITY_HOUSEKEEPING: "housekeeping"}
+_EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+_HOUSEKEEPING_METHODS = (*_EDIT_METHODS, DeleteMessage, DeleteMessages)
+# Uploads are retried by the delivery layer, which also backs off its upload concurrency on flood waits.
+_UPLOAD_METHODS = (SendVideo, SendDocument, SendMediaGroup)
+_MESSAGE_METHOD_PREFIXES = ("Send", "Copy", "Forward")
+
+
+def _creates_message(method: TelegramMethod) -> bool:
+    return type(method).__name__.startswith(_MESSAGE_METHOD_PREFIXES) and not isinstance(method, SendChatAction)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.blocked_until)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block_until(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+
+@dataclass
+class _Ticket:
+    priority: int
+    sequence: int
+    chat_id: int | str
+    method_name: str
+    enqueued_at: float
+    # Only message-creating calls count against the chat's rate; the rest just honour its flood wait.
+    charge_chat: bool
+    future: asyncio.Future[bool] = field(repr=False)
+    coalesce_key: tuple | None = None
+
+    @property
+    def order(self) -> tuple[int, int]:
+        return self.priority, self.sequence
+
+
+class TelegramRateScheduler(BaseRequestMiddleware):
+    """Session middleware pacing every chat-bound Bot API call.
+
+    Every call waits for the global token bucket; calls that post a message (send, copy, forward) also wait for
+    the chat's bucket, which is what Telegram limits per chat. Processing-message edits and deletes are not charged
+    to the chat, but a queued edit is dropped when a newer edit or a delete of the same message arrives, and a
+    duplicate delete is dropped outright. Flood waits block the chat's bucket and are retried here, except for
+    uploads, whose flood waits are raised to the delivery layer's own retry.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        private_rate: float = TELEGRAM_PRIVATE_RATE,
+        group_rate_per_minute: float = TELEGRAM_GROUP_RATE_PER_MINUTE,
+        chat_burst: int = TELEGRAM_CHAT_BURST,
+        flood_retries: int = TELEGRAM_FLOOD_RETRIES,
+    ) -> None:
+        self.private_rate = private_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.flood_retries = max(1, flood_retries)
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._queue: list[_Ticket] = []
+        self._coalescible: dict[tuple, _Ticket] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Negative ids (and @usernames) are groups and channels, which Telegram limits per minute.
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.private_rate if is_private else self.group_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = PRIORITY_HOUSEKEEPING if isinstance(method, _HOUSEKEEPING_METHODS) else PRIORITY_DELIVERY
+        method_name = type(method).__name__
+        attempt = 1
+        while True:
+            if not await self._acquire(chat_id, method, method_name, priority):
+                metrics.inc("telegram_coalesced", method=method_name)
+                # The session hands callers the bare method result; edits and deletes both report success as True.
+                return True
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                metrics.inc("telegram_flood_waits", method=method_name)
+                self._bucket(chat_id).block_until(time.monotonic() + exc.retry_after)
+                if isinstance(method, _UPLOAD_METHODS) or attempt >= self.flood_retries:
+                    raise
+                logger.warning(
+                    "Flood wait %ss for %s in chat %s (attempt %s/%s)",
+                    exc.retry_after,
+                    method_name,
+                    chat_id,
+                    attempt,
+                    self.flood_retries,
+                )
+                attempt += 1
+
+    @staticmethod
+    def _coalesce_key(method: TelegramMethod) -> tuple | None:
+        if isinstance(method, _EDIT_METHODS) and method.message_id is not None:
+            return ("edit", type(method).__name__, method.chat_id, method.message_id)
+        if isinstance(method, DeleteMessage):
+            return ("delete", method.chat_id, method.message_id)
+        return None
+
+    def _drop(self, ticket: _Ticket) -> None:
+        if not ticket.future.done():
+            ticket.future.set_result(False)
+        if ticket.coalesce_key and self._coalescible.get(ticket.coalesce_key) is ticket:
+            del self._coalescible[ticket.coalesce_key]
+
+    def _coalesce(self, method: TelegramMethod, key: tuple | None) -> bool:
+        """Drop queued operations made redundant by ``method``; False if ``method`` itself is redundant."""
+        if key is None:
+            return True
+        if key[0] == "delete":
+            if key in self._coalescible:
+                return False
+            for edit_key in [item for item in self._coalescible if item[0] == "edit" and item[2:] == key[1:]]:
+                self._drop(self._coalescible[edit_key])
+            return True
+        if ("delete", key[2], key[3]) in self._coalescible:
+            return False
+        previous = self._coalescible.get(key)
+        if previous is not None:
+            self._drop(previous)
+        return True
+
+    async def _acquire(self, chat_id: int | str, method: TelegramMethod, method_name: str, priority: int) -> bool:
+        key = self._coalesce_key(method)
+        if not self._coalesce(method, key):
+            return False
+
+        ticket = _Ticket(
+            priority=priority,
+            sequence=next(self._sequence),
+            chat_id=chat_id,
+            method_name=method_name,
+            enqueued_at=time.monotonic(),
+            charge_chat=_creates_message(method),
+            future=asyncio.get_running_loop().create_future(),
+            coalesce_key=key,
+        )
+        if key is not None:
+            self._coalescible[key] = ticket
+        self._queue.append(ticket)
+        self._publish_depth()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        try:
+            return await ticket.future
+        finally:
+            if not ticket.future.done():
+                ticket.future.cancel()
+            self._drop(ticket)
+            self._wakeup.set()
+
+    def _publish_depth(self) -> None:
+        for priority, name in _PRIORITY_NAMES.items():
+            depth = sum(1 for ticket in self._queue if ticket.priority == priority and not ticket.future.done())
+            metrics.set("telegram_queue_depth", depth, priority=name)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._queue = [ticket for ticket in self._queue if not ticket.future.done()]
+            global_ready = self._global.ready_at(now)
+            earliest = math.inf
+            granted = None
+            for ticket in sorted(self._queue, key=lambda item: item.order):
+                bucket = self._bucket(ticket.chat_id)
+                chat_ready = bucket.ready_at(now) if ticket.charge_chat else bucket.blocked_until
+                ready = max(chat_ready, global_ready)
+                if ready <= now:
+                    granted = ticket
+                    break
+                earliest = min(earliest, ready)
+
+            if granted is not None:
+                self._queue.remove(granted)
+                self._global.take(now)
+                if granted.charge_chat:
+                    self._bucket(granted.chat_id).take(now)
+                if granted.coalesce_key and self._coalescible.get(granted.coalesce_key) is granted:
+                    del self._coalescible[granted.coalesce_key]
+                granted.future.set_result(True)
+                metrics.observe(
+                    "telegram_queue_wait_seconds",
+                    now - granted.enqueued_at,
+                    priority=_PRIORITY_NAMES[granted.priority],
+                )
+                self._publish_depth()
+                continue
+
+            self._wakeup.clear()
+            timeout = None if earliest == math.inf else earliest - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self) -> dict[str, object]:
+        pending = [ticket for ticket in self._queue if not ticket.future.done()]
+        now = time.monotonic()
+        return {
+            "queued": {
+                name: sum(1 for ticket in pending if ticket.priority == priority)
+                for priority, name in _PRIORITY_NAMES.items()
+            },
+            "oldest_wait_seconds": round(max((now - ticket.enqueued_at for ticket in pending), default=0.0), 2),
+            "chats_tracked": len(self._chats),
+            "flood_blocked_chats": sum(1 for bucket in self._chats.values() if bucket.blocked_until > now),
+        }
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
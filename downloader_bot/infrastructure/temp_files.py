@@ -4,6 +4,9 @@ import uuid
 
 from downloader_bot.config import DATA_DIR
 
+# SQLite state (file_id cache etc.) lives next to temp dirs and must survive restarts.
+PERSISTENT_DATA_SUFFIXES = (".sqlite3", ".sqlite3-wal", ".sqlite3-shm", ".sqlite3-journal")
+
 
 def ensure_data_dir() -> None:
     DATA_DIR.mkdir(exist_ok=True)
@@ -34,6 +37,8 @@ def cleanup_temp_dir(temp_dir: str | None) -> None:
 def clean_data_dir() -> None:
     ensure_data_dir()
     for item in DATA_DIR.glob("*"):
+        if item.name.endswith(PERSISTENT_DATA_SUFFIXES):
+            continue
         try:
             if item.is_file():
                 item.unlink()
@@ -1,83 +1,543 @@
+import asyncio
+import bisect
 import logging
 import math
 import os
-import subprocess
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
 
-from downloader_bot.config import MAX_SINGLE_FILE_SIZE
+from downloader_bot.config import (
+    FIT_AUDIO_BITRATE_KBPS,
+    FIT_MIN_VIDEO_BITRATE_KBPS,
+    FIT_TRANSCODE_CONCURRENCY,
+    FIT_TRANSCODE_MAX_SECONDS,
+    FIT_TRANSCODE_PRESET,
+    FIT_TRANSCODE_SPEED,
+    FIT_TRANSCODE_THREADS,
+    MAX_SINGLE_FILE_SIZE,
+    SPLIT_MAX_RESPLIT_DEPTH,
+    SPLIT_MODE,
+    SPLIT_SIZE_HEADROOM,
+)
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.media.mp4 import Mp4Info, read_mp4_info
+from downloader_bot.media.process_runner import run_process
+from downloader_bot.models import MediaPacket, VideoPart
 
 
 def bytes_to_mb(bytes_size: int) -> float:
     return bytes_size / (1024 * 1024)
 
 
-async def split_video_with_ffmpeg(video_path: str, video_dir: str) -> tuple[list[str], int]:
+async def probe_duration(video_path: str) -> float | None:
+    info = await asyncio.to_thread(read_mp4_info, video_path)
+    if info and info.duration:
+        return info.duration
+
+    probe_cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        video_path,
+    ]
+    result = await run_process(probe_cmd, timeout=60, name="ffprobe")
+    if not result.ok:
+        logging.error("Error getting video duration: %s", result.stderr)
+        return None
     try:
-        output_pattern = os.path.join(video_dir, "part_%03d.mp4")
-        probe_cmd = [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            video_path,
-        ]
+        return float(result.stdout.decode().strip())
+    except (ValueError, TypeError):
+        logging.error("Invalid duration value: %s", result.stdout)
+        return None
 
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            logging.error("Error getting video duration: %s", result.stderr)
-            return [], 0
-
-        try:
-            total_duration = float(result.stdout.strip())
-        except (ValueError, TypeError):
-            logging.error("Invalid duration value: %s", result.stdout)
-            return [], 0
-
-        file_size = os.path.getsize(video_path)
-        file_size_mb = bytes_to_mb(file_size)
-        max_size_mb = MAX_SINGLE_FILE_SIZE / (1024 * 1024)
-        num_parts = math.ceil(file_size_mb / max_size_mb)
-        segment_duration = math.floor(total_duration / num_parts)
-        if segment_duration < 30:
-            segment_duration = 30
 
-        cmd = [
-            "ffmpeg",
-            "-i",
-            video_path,
-            "-c",
-            "copy",
-            "-map",
-            "0",
-            "-f",
-            "segment",
-            "-segment_time",
-            str(segment_duration),
-            "-reset_timestamps",
-            "1",
-            "-segment_format",
-            "mp4",
-            output_pattern,
-        ]
+@dataclass(frozen=True)
+class MediaProbe:
+    packets: list[MediaPacket]
+    duration: float | None
+    width: int | None
+    height: int | None
+
+    @property
+    def keyframes(self) -> list[float]:
+        return sorted({packet.time for packet in self.packets if packet.keyframe})
+
+
+def _optional_number(value: str | None, kind: type) -> int | float | None:
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def probe_media(video_path: str) -> MediaProbe | None:
+    """Per-packet sizes and keyframes plus container duration and video dimensions.
+
+    MP4 files are read in-process from their sample tables; anything else takes one ffprobe pass.
+    """
+    info = await asyncio.to_thread(read_mp4_info, video_path)
+    if info and info.packets:
+        return MediaProbe(packets=info.packets, duration=info.duration, width=info.width, height=info.height)
+
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "packet=codec_type,pts_time,dts_time,size,flags:stream=codec_type,width,height:format=duration",
+        "-of",
+        "compact",
+        video_path,
+    ]
+    result = await run_process(cmd, timeout=120, name="ffprobe-packets")
+    if not result.ok:
+        logging.error("Error probing packets: %s", result.stderr)
+        return None
+
+    packets = []
+    duration = width = height = None
+    for line in result.stdout.decode(errors="replace").splitlines():
+        section, _, rest = line.partition("|")
+        fields = dict(item.split("=", 1) for item in rest.split("|") if "=" in item)
+        if section == "format":
+            duration = _optional_number(fields.get("duration"), float)
+            continue
+        if section == "stream":
+            if fields.get("codec_type") == "video" and width is None:
+                width = _optional_number(fields.get("width"), int)
+                height = _optional_number(fields.get("height"), int)
+            continue
+        if section != "packet":
+            continue
+
+        timestamp = fields.get("pts_time")
+        if timestamp in (None, "N/A"):
+            timestamp = fields.get("dts_time")
+        time_value = _optional_number(timestamp, float)
+        size = _optional_number(fields.get("size"), int)
+        if time_value is None or size is None:
+            continue
+        keyframe = fields.get("codec_type") == "video" and fields.get("flags", "").startswith("K")
+        packets.append(MediaPacket(time=time_value, size=size, keyframe=keyframe))
+    packets.sort(key=lambda packet: packet.time)
+    return MediaProbe(packets=packets, duration=duration, width=width, height=height)
+
+
+def plan_size_cuts(packets: list[MediaPacket], budget: int) -> list[tuple[float, float | None]]:
+    """Greedy keyframe cut points so each segment's packet bytes stay within ``budget``."""
+    if not packets:
+        return []
+    times = [packet.time for packet in packets]
+    prefix = [0]
+    for packet in packets:
+        prefix.append(prefix[-1] + packet.size)
+    keyframes = sorted({packet.time for packet in packets if packet.keyframe})
+
+    def bytes_between(start: float, end: float | None) -> int:
+        end_index = len(times) if end is None else bisect.bisect_left(times, end)
+        return prefix[end_index] - prefix[bisect.bisect_left(times, start)]
+
+    segments: list[tuple[float, float | None]] = []
+    start = times[0]
+    while True:
+        if bytes_between(start, None) <= budget:
+            segments.append((start, None))
+            return segments
+
+        first = bisect.bisect_right(keyframes, start)
+        if first >= len(keyframes):
+            segments.append((start, None))
+            return segments
+
+        low, high = first, len(keyframes) - 1
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            if bytes_between(start, keyframes[middle]) <= budget:
+                best = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+        # A single GOP larger than the budget cannot be cut with stream copy; keep it whole.
+        end = keyframes[best if best is not None else first]
+        segments.append((start, end))
+        start = end
+
+
+def plan_duration_cuts(
+    keyframes: list[float],
+    total_duration: float,
+    segment_duration: float,
+) -> list[tuple[float, float | None]]:
+    """Fixed-length segments, each cut moved forward to the next keyframe like the segment muxer does."""
+    boundaries: list[float] = []
+    target = segment_duration
+    while target < total_duration:
+        cut = target
+        if keyframes:
+            index = bisect.bisect_left(keyframes, target)
+            if index >= len(keyframes):
+                break
+            cut = keyframes[index]
+        if cut >= total_duration:
+            break
+        if not boundaries or cut > boundaries[-1]:
+            boundaries.append(cut)
+        target += segment_duration
+    return list(zip([0.0, *boundaries], [*boundaries, None]))
+
+
+async def cut_part(
+    video_path: str,
+    start: float,
+    end: float | None,
+    output_path: str,
+    thumbnail_path: str | None = None,
+) -> bool:
+    """Stream-copy one segment and, from the same input seek, grab its first frame as a JPEG."""
+    start = max(0.0, start)
+    # Input seeking lands on the keyframe at or before -ss; nudge forward so rounding never
+    # pulls in the previous GOP.
+    cmd = ["ffmpeg", "-y", "-v", "error", "-ss", f"{start + 0.001:.6f}" if start > 0 else "0"]
+    if end is not None:
+        cmd += ["-t", f"{end - start:.6f}"]
+    cmd += ["-i", video_path, "-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero"]
+    cmd += ["-movflags", "+faststart", output_path]
+    if thumbnail_path:
+        cmd += ["-map", "0:v:0", "-frames:v", "1", "-q:v", "2", "-f", "image2", thumbnail_path]
+    result = await run_process(cmd, name="ffmpeg-cut")
+    if not result.ok:
+        logging.error("Error cutting segment %.2f-%s: %s", start, end, result.stderr)
+        return False
+    return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+
+class SplitError(RuntimeError):
+    pass
+
+
+@dataclass
+class SplitProgress:
+    """Part count known so far; grows if an oversized part has to be re-split."""
+
+    total_parts: int = 0
+
+
+def remove_video_part(part: VideoPart) -> None:
+    for path in (part.path, part.thumbnail_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+async def _cut_video_part(
+    video_path: str,
+    video_dir: str,
+    name: str,
+    start: float,
+    end: float | None,
+    probe: MediaProbe | None,
+    total_duration: float | None,
+) -> VideoPart | None:
+    part_path = os.path.join(video_dir, f"{name}.mp4")
+    has_video = probe is None or probe.width is not None
+    thumbnail_path = os.path.join(video_dir, f"{name}.jpg") if has_video else None
+    if not await cut_part(video_path, start, end, part_path, thumbnail_path):
+        return None
+    if thumbnail_path and not (os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0):
+        thumbnail_path = None
+
+    stop = end if end is not None else total_duration
+    return VideoPart(
+        path=part_path,
+        thumbnail_path=thumbnail_path,
+        duration=max(0.0, stop - max(0.0, start)) if stop is not None else None,
+        width=probe.width if probe else None,
+        height=probe.height if probe else None,
+    )
 
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        _, stderr = process.communicate()
-        if process.returncode != 0:
-            logging.error("Error splitting video with ffmpeg: %s", stderr.decode())
-            return [], 0
-
-        parts = sorted(
-            os.path.join(video_dir, file_name)
-            for file_name in os.listdir(video_dir)
-            if file_name.startswith("part_") and file_name.endswith(".mp4")
-        )
-        valid_parts = [part for part in parts if os.path.getsize(part) > 0]
-        return valid_parts, len(valid_parts)
+
+async def _plan_by_size(
+    video_path: str,
+    depth: int,
+    probe: MediaProbe | None = None,
+) -> tuple[MediaProbe, list[tuple[float, float | None]]] | None:
+    probe = probe or await probe_media(video_path)
+    if not probe or not probe.packets:
+        return None
+    budget = int(MAX_SINGLE_FILE_SIZE * SPLIT_SIZE_HEADROOM ** (depth + 1))
+    segments = plan_size_cuts(probe.packets, budget)
+    if len(segments) < 2 and depth > 0:
+        logging.warning("Cannot split %s further at keyframes; keeping it whole", video_path)
+        return None
+    return probe, segments
+
+
+async def _plan_by_duration(
+    video_path: str,
+    probe: MediaProbe | None,
+) -> tuple[list[tuple[float, float | None]], float] | None:
+    total_duration = probe.duration if probe and probe.duration else await probe_duration(video_path)
+    if total_duration is None:
+        return None
+
+    file_size = os.path.getsize(video_path)
+    file_size_mb = bytes_to_mb(file_size)
+    max_size_mb = MAX_SINGLE_FILE_SIZE / (1024 * 1024)
+    num_parts = math.ceil(file_size_mb / max_size_mb)
+    segment_duration = math.floor(total_duration / num_parts)
+    if segment_duration < 30:
+        segment_duration = 30
+    return plan_duration_cuts(probe.keyframes if probe else [], total_duration, segment_duration), total_duration
+
+
+async def _iter_segments(
+    video_path: str,
+    video_dir: str,
+    prefix: str,
+    depth: int,
+    segments: list[tuple[float, float | None]],
+    probe: MediaProbe | None,
+    total_duration: float | None,
+    progress: SplitProgress,
+) -> AsyncIterator[VideoPart]:
+    for index, (start, end) in enumerate(segments, 1):
+        name = f"{prefix}_{index:03d}"
+        part = await _cut_video_part(video_path, video_dir, name, start, end, probe, total_duration)
+        if part is None:
+            raise SplitError(f"Failed to cut {name} from {video_path}")
+
+        part_size = os.path.getsize(part.path)
+        if part_size > MAX_SINGLE_FILE_SIZE and depth < SPLIT_MAX_RESPLIT_DEPTH:
+            logging.warning(
+                "Part %s is %.2fMB, over the %.2fMB limit; re-splitting it",
+                part.path,
+                bytes_to_mb(part_size),
+                bytes_to_mb(MAX_SINGLE_FILE_SIZE),
+            )
+            plan = await _plan_by_size(part.path, depth + 1)
+            if plan:
+                sub_probe, sub_segments = plan
+                progress.total_parts += len(sub_segments) - 1
+                sub_duration = sub_probe.duration if sub_probe.duration is not None else part.duration
+                async for sub_part in _iter_segments(
+                    part.path, video_dir, name, depth + 1, sub_segments, sub_probe, sub_duration, progress
+                ):
+                    yield sub_part
+                remove_video_part(part)
+                continue
+        yield part
+
+
+def log_part_sizes(sizes: list[int]) -> None:
+    if not sizes:
+        return
+    sizes = sorted(sizes)
+    over_limit = sum(1 for size in sizes if size > MAX_SINGLE_FILE_SIZE)
+    logging.info(
+        "Split into %s parts: min %.2fMB, median %.2fMB, max %.2fMB, limit %.2fMB, over limit %s",
+        len(sizes),
+        bytes_to_mb(sizes[0]),
+        bytes_to_mb(sizes[len(sizes) // 2]),
+        bytes_to_mb(sizes[-1]),
+        bytes_to_mb(MAX_SINGLE_FILE_SIZE),
+        over_limit,
+    )
+
+
+async def iter_video_parts(video_path: str, video_dir: str, progress: SplitProgress) -> AsyncIterator[VideoPart]:
+    """Yield each part, with its thumbnail and metadata, as soon as it is cut.
+
+    ``progress.total_parts`` is set before the first part is cut. Raises SplitError if a part cannot be cut.
+    """
+    probe = await probe_media(video_path)
+    plan = await _plan_by_size(video_path, 0, probe) if SPLIT_MODE == "size" else None
+    if plan:
+        probe, segments = plan
+        prefix = "part"
+        total_duration = probe.duration if probe.duration is not None else probe.packets[-1].time
+    else:
+        if SPLIT_MODE == "size":
+            logging.warning("Size-targeted split failed for %s, falling back to duration split", video_path)
+        duration_plan = await _plan_by_duration(video_path, probe)
+        if duration_plan is None:
+            raise SplitError(f"Cannot determine duration of {video_path}")
+        segments, total_duration = duration_plan
+        prefix = "segment"
+
+    progress.total_parts = len(segments)
+    sizes: list[int] = []
+    async for part in _iter_segments(
+        video_path, video_dir, prefix, 0, segments, probe, total_duration, progress
+    ):
+        sizes.append(os.path.getsize(part.path))
+        yield part
+    log_part_sizes(sizes)
+
+
+async def split_video_with_ffmpeg(video_path: str, video_dir: str) -> list[VideoPart]:
+    try:
+        return [part async for part in iter_video_parts(video_path, video_dir, SplitProgress())]
     except Exception as exc:
         logging.error("Error in split_video_with_ffmpeg: %s", exc)
-        return [], 0
+        return []
+
+
+@dataclass(frozen=True)
+class FitPlan:
+    duration: float
+    video_kbps: int
+    predicted_seconds: float
+
+
+# Share of the byte budget targeted by the encoder; single-pass ABR overshoots by a few percent.
+_FIT_BITRATE_HEADROOM = 0.92
+_fit_slots = asyncio.Semaphore(max(1, FIT_TRANSCODE_CONCURRENCY))
+_encode_speed = FIT_TRANSCODE_SPEED
+
+
+def plan_fit_transcode(duration: float, max_bytes: int) -> tuple[FitPlan | None, str]:
+    total_kbps = max_bytes * _FIT_BITRATE_HEADROOM * 8 / duration / 1000
+    video_kbps = int(total_kbps - FIT_AUDIO_BITRATE_KBPS)
+    predicted = duration / _encode_speed
+    if video_kbps < FIT_MIN_VIDEO_BITRATE_KBPS:
+        return None, f"target {video_kbps}kbps is below {FIT_MIN_VIDEO_BITRATE_KBPS}kbps"
+    if predicted > FIT_TRANSCODE_MAX_SECONDS:
+        return None, f"predicted encode {predicted:.0f}s exceeds {FIT_TRANSCODE_MAX_SECONDS:.0f}s"
+    return FitPlan(duration=duration, video_kbps=video_kbps, predicted_seconds=predicted), "ok"
+
+
+async def fit_video_to_size(video_path: str, video_dir: str, max_bytes: int) -> str | None:
+    """Re-encode with x264 at a bitrate derived from duration and ``max_bytes``.
+
+    Returns the encoded file only if it fits; None means the caller should split instead.
+    """
+    global _encode_speed
+    duration = await probe_duration(video_path)
+    if not duration:
+        logging.info("Fit transcode skipped for %s: unknown duration", video_path)
+        metrics.inc("oversize_strategy", strategy="split", reason="no_duration")
+        return None
+
+    plan, reason = plan_fit_transcode(duration, max_bytes)
+    if plan is None:
+        logging.info("Oversized video %s: splitting (%s)", video_path, reason)
+        metrics.inc("oversize_strategy", strategy="split", reason="plan")
+        return None
+
+    logging.info(
+        "Oversized video %s: transcoding %.0fs at %skbps, predicted %.1fs",
+        video_path,
+        plan.duration,
+        plan.video_kbps,
+        plan.predicted_seconds,
+    )
+    output_path = os.path.join(video_dir, "fitted.mp4")
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        video_path,
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-c:v",
+        "libx264",
+        "-preset",
+        FIT_TRANSCODE_PRESET,
+        "-threads",
+        str(max(1, FIT_TRANSCODE_THREADS)),
+        "-b:v",
+        f"{plan.video_kbps}k",
+        "-maxrate",
+        f"{int(plan.video_kbps * 1.5)}k",
+        "-bufsize",
+        f"{plan.video_kbps * 2}k",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-b:a",
+        f"{FIT_AUDIO_BITRATE_KBPS}k",
+        "-movflags",
+        "+faststart",
+        output_path,
+    ]
+    async with _fit_slots:
+        result = await run_process(cmd, timeout=max(60.0, FIT_TRANSCODE_MAX_SECONDS * 2), name="ffmpeg-fit")
+
+    metrics.observe("fit_transcode_seconds", result.elapsed_seconds)
+    if not result.ok or not os.path.exists(output_path):
+        logging.error("Fit transcode failed after %.1fs: %s", result.elapsed_seconds, result.stderr)
+        metrics.inc("oversize_strategy", strategy="split", reason="encode_failed")
+        return None
+
+    if result.elapsed_seconds > 0:
+        # Exponential average so one unusual video does not swing the prediction.
+        _encode_speed = 0.7 * _encode_speed + 0.3 * (plan.duration / result.elapsed_seconds)
+    size = os.path.getsize(output_path)
+    logging.info(
+        "Fit transcode finished in %.1fs (predicted %.1fs): %.2fMB of %.2fMB allowed",
+        result.elapsed_seconds,
+        plan.predicted_seconds,
+        bytes_to_mb(size),
+        bytes_to_mb(max_bytes),
+    )
+    if size > max_bytes:
+        os.remove(output_path)
+        metrics.inc("oversize_strategy", strategy="split", reason="overshoot")
+        return None
+    metrics.inc("oversize_strategy", strategy="transcode", reason="ok")
+    return output_path
+
+
+async def ensure_faststart(video_path: str) -> Mp4Info | None:
+    """Move a trailing moov to the front with a stream-copy remux so playback can start before the download ends.
+
+    Returns the (possibly rewritten) file's metadata, or None if it is not a parseable MP4.
+    """
+    info = await asyncio.to_thread(read_mp4_info, video_path)
+    if info is None or info.moov_at_front:
+        return info
+
+    remuxed_path = f"{os.path.splitext(video_path)[0]}.faststart.mp4"
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        video_path,
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        remuxed_path,
+    ]
+    result = await run_process(cmd, name="ffmpeg-faststart")
+    metrics.observe("faststart_remux_seconds", result.elapsed_seconds)
+    if not result.ok or not os.path.exists(remuxed_path):
+        logging.error("Faststart remux failed after %.2fs: %s", result.elapsed_seconds, result.stderr)
+        if os.path.exists(remuxed_path):
+            os.remove(remuxed_path)
+        return info
+
+    os.replace(remuxed_path, video_path)
+    logging.info(
+        "Moved moov to the front of %s (%.2fMB) in %.2fs",
+        video_path,
+        bytes_to_mb(os.path.getsize(video_path)),
+        result.elapsed_seconds,
+    )
+    return await asyncio.to_thread(read_mp4_info, video_path)
 
 
 async def create_thumbnail(video_path: str, video_dir: str, unique_suffix: int | None = None) -> str | None:
@@ -87,10 +547,10 @@ async def create_thumbnail(video_path: str, video_dir: str, unique_suffix: int |
     try:
         cmd = [
             "ffmpeg",
-            "-i",
-            video_path,
             "-ss",
             "00:00:03",
+            "-i",
+            video_path,
             "-frames:v",
             "1",
             "-q:v",
@@ -99,10 +559,9 @@ async def create_thumbnail(video_path: str, video_dir: str, unique_suffix: int |
             "image2",
             thumbnail_path,
         ]
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        _, stderr = process.communicate()
-        if process.returncode != 0:
-            logging.error("Error creating thumbnail: %s", stderr.decode())
+        result = await run_process(cmd, timeout=60, name="ffmpeg-thumbnail")
+        if not result.ok:
+            logging.error("Error creating thumbnail: %s", result.stderr)
             return None
 
         if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
@@ -131,10 +590,9 @@ async def create_first_frame_thumbnail_from_remote(video_url: str, temp_dir: str
             "image2",
             thumbnail_path,
         ]
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        _, stderr = process.communicate()
-        if process.returncode != 0:
-            logging.error("Error creating inline thumbnail: %s", stderr.decode())
+        result = await run_process(cmd, timeout=30, name="ffmpeg-inline-thumbnail")
+        if not result.ok:
+            logging.error("Error creating inline thumbnail: %s", result.stderr)
             return None
 
         if os.path.exists(thumbnail_path) and os.path.getsize(thumbnail_path) > 0:
@@ -0,0 +1,225 @@
+import logging
+import mmap
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from downloader_bot.models import MediaPacket
+
+
+class Mp4ParseError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Mp4Info:
+    duration: float | None
+    width: int | None
+    height: int | None
+    moov_at_front: bool
+    packets: list[MediaPacket] = field(repr=False)
+
+    @property
+    def keyframes(self) -> list[float]:
+        return sorted({packet.time for packet in self.packets if packet.keyframe})
+
+
+@dataclass
+class _Track:
+    handler: bytes = b""
+    timescale: int = 0
+    width: int | None = None
+    height: int | None = None
+    rotated: bool = False
+    media_time: int = 0
+    empty_edit: int = 0
+    deltas: list[tuple[int, int]] = field(default_factory=list)
+    offsets: list[tuple[int, int]] = field(default_factory=list)
+    sizes: list[int] = field(default_factory=list)
+    sync: set[int] | None = None
+
+
+def _iter_boxes(buf: mmap.mmap, start: int, end: int) -> Iterator[tuple[bytes, int, int, int]]:
+    """Yield (type, box_offset, payload_start, box_end) for boxes laid out in ``buf[start:end]``."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise Mp4ParseError(f"bad {box_type!r} box size {size} at {offset}")
+        yield box_type, offset, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _child(buf: mmap.mmap, start: int, end: int, box_type: bytes) -> tuple[int, int] | None:
+    for child_type, _, payload, box_end in _iter_boxes(buf, start, end):
+        if child_type == box_type:
+            return payload, box_end
+    return None
+
+
+def _fixed_16_16(value: int) -> float:
+    return value / 65536
+
+
+def _read_mvhd(buf: mmap.mmap, start: int) -> tuple[int, int]:
+    if buf[start] == 1:
+        return struct.unpack_from(">IQ", buf, start + 20)
+    return struct.unpack_from(">II", buf, start + 12)
+
+
+def _read_tkhd(buf: mmap.mmap, start: int, track: _Track) -> None:
+    base = start + (84 if buf[start] == 1 else 72) + 4
+    a, b = struct.unpack_from(">ii", buf, base - 36)
+    width, height = struct.unpack_from(">II", buf, base)
+    track.width = round(_fixed_16_16(width)) or None
+    track.height = round(_fixed_16_16(height)) or None
+    # A 90/270 degree display matrix has a == 0 and |b| == 1.
+    track.rotated = a == 0 and abs(b) == 0x10000
+
+
+def _read_elst(buf: mmap.mmap, start: int, track: _Track) -> None:
+    version = buf[start]
+    (count,) = struct.unpack_from(">I", buf, start + 4)
+    entry_format, entry_size = (">Qq", 20) if version == 1 else (">Ii", 12)
+    offset = start + 8
+    for _ in range(count):
+        segment_duration, media_time = struct.unpack_from(entry_format, buf, offset)
+        offset += entry_size
+        if media_time == -1:
+            track.empty_edit += segment_duration
+            continue
+        track.media_time = media_time
+        return
+
+
+def _read_pairs(buf: mmap.mmap, start: int, signed: bool = False) -> list[tuple[int, int]]:
+    (count,) = struct.unpack_from(">I", buf, start + 4)
+    entry_format = ">Ii" if signed else ">II"
+    return list(struct.iter_unpack(entry_format, buf[start + 8 : start + 8 + count * 8]))
+
+
+def _read_stbl(buf: mmap.mmap, start: int, end: int, track: _Track) -> None:
+    for box_type, _, payload, _ in _iter_boxes(buf, start, end):
+        if box_type == b"stts":
+            track.deltas = _read_pairs(buf, payload)
+        elif box_type == b"ctts":
+            track.offsets = _read_pairs(buf, payload, signed=buf[payload] == 1)
+        elif box_type == b"stss":
+            (count,) = struct.unpack_from(">I", buf, payload + 4)
+            track.sync = set(struct.unpack_from(f">{count}I", buf, payload + 8))
+        elif box_type == b"stsz":
+            sample_size, count = struct.unpack_from(">II", buf, payload + 4)
+            if sample_size:
+                track.sizes = [sample_size] * count
+            else:
+                track.sizes = list(struct.unpack_from(f">{count}I", buf, payload + 12))
+
+
+def _read_trak(buf: mmap.mmap, start: int, end: int) -> _Track:
+    track = _Track()
+    tkhd = _child(buf, start, end, b"tkhd")
+    if tkhd:
+        _read_tkhd(buf, tkhd[0], track)
+    edts = _child(buf, start, end, b"edts")
+    elst = _child(buf, *edts, b"elst") if edts else None
+    if elst:
+        _read_elst(buf, elst[0], track)
+
+    mdia = _child(buf, start, end, b"mdia")
+    if not mdia:
+        return track
+    hdlr = _child(buf, *mdia, b"hdlr")
+    if hdlr:
+        track.handler = bytes(buf[hdlr[0] + 8 : hdlr[0] + 12])
+    mdhd = _child(buf, *mdia, b"mdhd")
+    if mdhd:
+        track.timescale = (
+            struct.unpack_from(">I", buf, mdhd[0] + 20)[0]
+            if buf[mdhd[0]] == 1
+            else struct.unpack_from(">I", buf, mdhd[0] + 12)[0]
+        )
+    minf = _child(buf, *mdia, b"minf")
+    stbl = _child(buf, *minf, b"stbl") if minf else None
+    if stbl:
+        _read_stbl(buf, *stbl, track)
+    return track
+
+
+def _track_packets(track: _Track, movie_timescale: int) -> list[MediaPacket]:
+    if not track.timescale or not track.sizes:
+        return []
+    is_video = track.handler == b"vide"
+    shift = track.empty_edit / movie_timescale if movie_timescale else 0.0
+    offsets = iter(offset for count, offset in track.offsets for _ in range(count))
+
+    packets = []
+    decode_time = 0
+    sample = 0
+    for count, delta in track.deltas:
+        for _ in range(count):
+            if sample >= len(track.sizes):
+                break
+            composition = decode_time + next(offsets, 0)
+            sample += 1
+            packets.append(
+                MediaPacket(
+                    time=(composition - track.media_time) / track.timescale + shift,
+                    size=track.sizes[sample - 1],
+                    keyframe=is_video and (track.sync is None or sample in track.sync),
+                )
+            )
+            decode_time += delta
+    return packets
+
+
+def _parse(buf: mmap.mmap) -> Mp4Info | None:
+    moov = None
+    moov_offset = mdat_offset = None
+    for box_type, offset, payload, box_end in _iter_boxes(buf, 0, len(buf)):
+        if box_type == b"moov":
+            moov, moov_offset = (payload, box_end), offset
+        elif box_type == b"mdat" and mdat_offset is None:
+            mdat_offset = offset
+    if moov is None:
+        return None
+
+    mvhd = _child(buf, *moov, b"mvhd")
+    movie_timescale, movie_duration = _read_mvhd(buf, mvhd[0]) if mvhd else (0, 0)
+    tracks = [
+        _read_trak(buf, payload, box_end)
+        for box_type, _, payload, box_end in _iter_boxes(buf, *moov)
+        if box_type == b"trak"
+    ]
+
+    video = next((track for track in tracks if track.handler == b"vide"), None)
+    width = height = None
+    if video and video.width and video.height:
+        width, height = (video.height, video.width) if video.rotated else (video.width, video.height)
+
+    packets = [packet for track in tracks for packet in _track_packets(track, movie_timescale)]
+    packets.sort(key=lambda packet: packet.time)
+    return Mp4Info(
+        duration=movie_duration / movie_timescale if movie_timescale and movie_duration else None,
+        width=width,
+        height=height,
+        moov_at_front=mdat_offset is None or moov_offset < mdat_offset,
+        packets=packets,
+    )
+
+
+def read_mp4_info(path: str) -> Mp4Info | None:
+    """Parse the moov box in-process; None for non-MP4, fragmented or damaged files."""
+    try:
+        with open(path, "rb") as file_obj, mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _parse(buf)
+    except (OSError, ValueError, struct.error) as exc:
+        logging.warning("Could not parse MP4 boxes of %s: %s", path, exc)
+        return None
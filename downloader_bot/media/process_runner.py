@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from downloader_bot.config import FFMPEG_MAX_PROCESSES, FFMPEG_TIMEOUT_SECONDS
+from downloader_bot.infrastructure.metrics import metrics
+
+STDERR_TAIL_BYTES = 4096
+
+_process_slots = asyncio.Semaphore(max(1, FFMPEG_MAX_PROCESSES))
+_running = 0
+
+
+@dataclass(frozen=True)
+class ProcessResult:
+    returncode: int
+    stdout: bytes
+    stderr: str
+    elapsed_seconds: float
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+async def _kill(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is not None:
+        return
+    try:
+        process.kill()
+    except ProcessLookupError:
+        return
+    await process.wait()
+
+
+async def run_process(
+    cmd: list[str],
+    timeout: float | None = FFMPEG_TIMEOUT_SECONDS,
+    name: str | None = None,
+) -> ProcessResult:
+    """Run a media tool without blocking the event loop; killed on timeout or cancellation."""
+    global _running
+    name = name or cmd[0]
+    async with _process_slots:
+        _running += 1
+        metrics.set("media_processes_running", _running)
+        started = time.monotonic()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await _kill(process)
+                elapsed = time.monotonic() - started
+                logging.error("%s timed out after %.1fs", name, elapsed)
+                metrics.inc("media_process_timeouts", name=name)
+                return ProcessResult(returncode=-1, stdout=b"", stderr="timed out", elapsed_seconds=elapsed, timed_out=True)
+            except asyncio.CancelledError:
+                await _kill(process)
+                raise
+        finally:
+            _running -= 1
+            metrics.set("media_processes_running", _running)
+
+    elapsed = time.monotonic() - started
+    metrics.observe("media_process_seconds", elapsed, name=name)
+    return ProcessResult(
+        returncode=process.returncode,
+        stdout=stdout,
+        stderr=stderr[-STDERR_TAIL_BYTES:].decode(errors="replace"),
+        elapsed_seconds=elapsed,
+    )
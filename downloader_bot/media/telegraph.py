@@ -4,8 +4,10 @@ import os
 import aiofiles
 import aiohttp
 
+from downloader_bot.infrastructure.http_client import BACKEND_TELEGRAPH, HttpClient
 
-async def upload_image_to_telegra_ph(file_path: str) -> str | None:
+
+async def upload_image_to_telegra_ph(http_client: HttpClient, file_path: str) -> str | None:
     try:
         form = aiohttp.FormData()
         async with aiofiles.open(file_path, "rb") as file_obj:
@@ -16,18 +18,18 @@ async def upload_image_to_telegra_ph(file_path: str) -> str | None:
             filename=os.path.basename(file_path),
             content_type="image/jpeg",
         )
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://telegra.ph/upload", data=form) as response:
-                if response.status != 200:
-                    logging.error("Telegraph upload failed: HTTP %s", response.status)
-                    return None
-                payload = await response.json()
-                if isinstance(payload, list) and payload and isinstance(payload[0], dict):
-                    src = payload[0].get("src")
-                    if src:
-                        return "https://telegra.ph" + src
-                logging.error("Unexpected telegraph response: %s", payload)
+        session = http_client.session(BACKEND_TELEGRAPH)
+        async with session.post("https://telegra.ph/upload", data=form) as response:
+            if response.status != 200:
+                logging.error("Telegraph upload failed: HTTP %s", response.status)
                 return None
+            payload = await response.json()
+            if isinstance(payload, list) and payload and isinstance(payload[0], dict):
+                src = payload[0].get("src")
+                if src:
+                    return "https://telegra.ph" + src
+            logging.error("Unexpected telegraph response: %s", payload)
+            return None
     except Exception as exc:
         logging.error("Error uploading to telegra.ph: %s", exc)
         return None
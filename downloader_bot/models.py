@@ -15,3 +15,58 @@ class VideoInfo:
     thumbnail_url: str | None
     filename: str
     source: str
+
+
+@dataclass(frozen=True)
+class TransferStats:
+    bytes_written: int
+    elapsed_seconds: float
+    peak_buffer_bytes: int
+
+    @property
+    def bytes_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return float(self.bytes_written)
+        return self.bytes_written / self.elapsed_seconds
+
+
+@dataclass(frozen=True)
+class CachedMedia:
+    kind: str
+    file_id: str
+
+
+@dataclass(frozen=True)
+class MediaPacket:
+    time: float
+    size: int
+    keyframe: bool
+
+
+@dataclass(frozen=True)
+class VideoPart:
+    path: str
+    thumbnail_path: str | None
+    duration: float | None
+    width: int | None
+    height: int | None
+
+
+@dataclass(frozen=True)
+class RelayReceipt:
+    # Id of the URL message the business bot posted; None for business bots that do not report it.
+    message_id: int | None
+
+
+@dataclass(frozen=True)
+class DeliveryTarget:
+    """Where a request's results go: the user's chat and topic, and the link message to clean up."""
+
+    chat_id: int
+    thread_id: int | None
+    message_id: int
+    chat_type: str
+
+    @property
+    def is_group(self) -> bool:
+        return self.chat_type in ("group", "supergroup")
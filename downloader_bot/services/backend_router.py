@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from downloader_bot.config import (
+    ROUTER_BREAKER_FAILURES,
+    ROUTER_BREAKER_OPEN_SECONDS,
+    ROUTER_MIN_SAMPLES,
+    ROUTER_WINDOW_SECONDS,
+    ROUTER_WINDOW_SIZE,
+)
+from downloader_bot.infrastructure.http_client import BackendUnavailableError
+from downloader_bot.infrastructure.metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+# Assumed latency for a backend with no successful samples yet.
+_UNKNOWN_LATENCY_SECONDS = 30.0
+
+
+@dataclass
+class _Outcome:
+    ok: bool
+    latency: float
+    at: float
+
+
+@dataclass
+class BackendStats:
+    outcomes: deque[_Outcome] = field(default_factory=lambda: deque(maxlen=ROUTER_WINDOW_SIZE))
+    consecutive_failures: int = 0
+    state: str = BREAKER_CLOSED
+    opened_at: float = 0.0
+    probe_in_flight: bool = False
+
+    def window(self, now: float) -> list[_Outcome]:
+        while self.outcomes and now - self.outcomes[0].at > ROUTER_WINDOW_SECONDS:
+            self.outcomes.popleft()
+        return list(self.outcomes)
+
+    def success_rate(self, now: float) -> float:
+        outcomes = self.window(now)
+        successes = sum(1 for outcome in outcomes if outcome.ok)
+        # Laplace smoothing keeps a single early failure from burying a backend.
+        return (successes + 1) / (len(outcomes) + 2)
+
+    def latency(self, now: float, fraction: float) -> float | None:
+        latencies = [outcome.latency for outcome in self.window(now) if outcome.ok]
+        if len(latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return percentile(latencies, fraction)
+
+
+class BackendRouter:
+    """Orders backends per platform by windowed success rate and latency, with a circuit breaker."""
+
+    def __init__(self, backends: list[str]) -> None:
+        self.backends = backends
+        self._stats: dict[tuple[str, str], BackendStats] = {}
+
+    def _get(self, backend: str, platform: str) -> BackendStats:
+        key = (backend, platform)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = BackendStats()
+        return stats
+
+    def _allows(self, stats: BackendStats, now: float) -> bool:
+        if stats.state == BREAKER_CLOSED:
+            return True
+        if stats.state == BREAKER_OPEN and now - stats.opened_at >= ROUTER_BREAKER_OPEN_SECONDS:
+            stats.state = BREAKER_HALF_OPEN
+        return stats.state == BREAKER_HALF_OPEN and not stats.probe_in_flight
+
+    def _expected_seconds(self, stats: BackendStats, now: float) -> float:
+        p50 = stats.latency(now, 0.5)
+        return (p50 if p50 is not None else _UNKNOWN_LATENCY_SECONDS) / stats.success_rate(now)
+
+    def order(self, platform: str) -> list[str]:
+        now = time.monotonic()
+        allowed = [backend for backend in self.backends if self._allows(self._get(backend, platform), now)]
+        if not allowed:
+            logger.warning("All backends are open for platform=%s, trying them anyway", platform)
+            return list(self.backends)
+        return sorted(
+            allowed,
+            key=lambda backend: (self._expected_seconds(self._get(backend, platform), now), self.backends.index(backend)),
+        )
+
+    def hedge_delay(self, backend: str, platform: str, default: float) -> float:
+        p95 = self._get(backend, platform).latency(time.monotonic(), 0.95)
+        return min(default, p95) if p95 is not None else default
+
+    def record(self, backend: str, platform: str, ok: bool, latency: float, unavailable: bool = False) -> None:
+        """Every outcome feeds the ranking; only ``unavailable`` ones (transport errors, 5xx) trip the breaker.
+
+        A backend that answered, even to refuse an unsupported or oversized video, is up.
+        """
+        now = time.monotonic()
+        stats = self._get(backend, platform)
+        stats.outcomes.append(_Outcome(ok=ok, latency=latency, at=now))
+        stats.probe_in_flight = False
+        if not unavailable:
+            if stats.state != BREAKER_CLOSED:
+                logger.info("Circuit closed for %s/%s after the probe was answered", backend, platform)
+            stats.state = BREAKER_CLOSED
+            stats.consecutive_failures = 0
+            return
+
+        stats.consecutive_failures += 1
+        if stats.state == BREAKER_HALF_OPEN or stats.consecutive_failures >= ROUTER_BREAKER_FAILURES:
+            if stats.state != BREAKER_OPEN:
+                logger.warning(
+                    "Circuit opened for %s/%s after %s consecutive failures",
+                    backend,
+                    platform,
+                    stats.consecutive_failures,
+                )
+            stats.state = BREAKER_OPEN
+            stats.opened_at = now
+
+    async def track(
+        self,
+        backend: str,
+        platform: str,
+        factory: Callable[[], Awaitable[T | None]],
+        is_valid: Callable[[T], bool] = lambda _result: True,
+    ) -> T | None:
+        stats = self._get(backend, platform)
+        if stats.state == BREAKER_HALF_OPEN:
+            stats.probe_in_flight = True
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            # A hedged loser says nothing about backend health.
+            stats.probe_in_flight = False
+            raise
+        except BackendUnavailableError:
+            self.record(backend, platform, False, time.monotonic() - started, unavailable=True)
+            raise
+        except Exception:
+            self.record(backend, platform, False, time.monotonic() - started)
+            raise
+        self.record(backend, platform, result is not None and is_valid(result), time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> dict[str, dict]:
+        now = time.monotonic()
+        result: dict[str, dict] = {}
+        for (backend, platform), stats in sorted(self._stats.items()):
+            outcomes = stats.window(now)
+            p50 = stats.latency(now, 0.5)
+            p95 = stats.latency(now, 0.95)
+            result.setdefault(platform, {})[backend] = {
+                "samples": len(outcomes),
+                "success_rate": round(sum(1 for outcome in outcomes if outcome.ok) / len(outcomes), 3)
+                if outcomes
+                else None,
+                "p50_seconds": round(p50, 2) if p50 is not None else None,
+                "p95_seconds": round(p95, 2) if p95 is not None else None,
+                "breaker": stats.state,
+                "consecutive_failures": stats.consecutive_failures,
+            }
+        return result
@@ -1,33 +1,111 @@
 import logging
+import os
 
+from downloader_bot.canonical_url import canonicalize_url
 from downloader_bot.clients.cobalt_client import CobaltClient
 from downloader_bot.clients.ytdlp_client import YtdlpClient
+from downloader_bot.config import (
+    DOWNLOAD_HEDGE_DELAY_SECONDS,
+    DOWNLOAD_HEDGING,
+    HEDGE_IMMEDIATE_PLATFORMS,
+    INFO_HEDGE_DELAY_SECONDS,
+    QUALITY_LADDER,
+    QUALITY_LADDER_BY_PLATFORM,
+)
+from downloader_bot.infrastructure.hedging import hedged_first
+from downloader_bot.infrastructure.temp_files import cleanup_temp_dir
 from downloader_bot.models import DownloadResult, VideoInfo
+from downloader_bot.services.backend_router import BackendRouter
+
+BACKEND_COBALT = "cobalt"
+BACKEND_DOWNLOADER = "downloader"
+
+
+def platform_of(url: str) -> str:
+    canonical = canonicalize_url(url)
+    return canonical.platform if canonical else "unknown"
+
+
+def quality_ladder(platform: str) -> list[int]:
+    return QUALITY_LADDER_BY_PLATFORM.get(platform, QUALITY_LADDER)
+
+
+def is_valid_download(result: DownloadResult) -> bool:
+    return os.path.exists(result.local_path) and os.path.getsize(result.local_path) > 0
+
+
+def discard_download(result: DownloadResult) -> None:
+    logging.info("Discarding %s result for %s", result.source, result.filename)
+    cleanup_temp_dir(result.temp_dir)
 
 
 class DownloadService:
-    def __init__(self, cobalt_client: CobaltClient, ytdlp_client: YtdlpClient) -> None:
+    def __init__(
+        self,
+        cobalt_client: CobaltClient,
+        ytdlp_client: YtdlpClient,
+        router: BackendRouter | None = None,
+    ) -> None:
         self.cobalt_client = cobalt_client
         self.ytdlp_client = ytdlp_client
+        self.router = router or BackendRouter([BACKEND_COBALT, BACKEND_DOWNLOADER])
+        self._clients = {BACKEND_COBALT: cobalt_client, BACKEND_DOWNLOADER: ytdlp_client}
+
+    def _delays(self, order: list[str], platform: str, default: float) -> list[float | None]:
+        if not DOWNLOAD_HEDGING:
+            return [None] * (len(order) - 1)
+        if platform in HEDGE_IMMEDIATE_PLATFORMS:
+            return [0.0] * (len(order) - 1)
+        return [self.router.hedge_delay(backend, platform, default) for backend in order[:-1]]
 
     async def download(self, url: str) -> DownloadResult | None:
-        logging.info("Trying Cobalt first for %s", url)
-        cobalt_result = await self.cobalt_client.download(url)
-        if cobalt_result:
-            logging.info("Download succeeded through %s", cobalt_result.source)
-            return cobalt_result
-
-        logging.warning("Cobalt download failed for %s, trying downloader fallback", url)
-        fallback_result = await self.ytdlp_client.download(url)
-        if fallback_result:
-            logging.info("Download succeeded through %s", fallback_result.source)
-        return fallback_result
+        platform = platform_of(url)
+        order = self.router.order(platform)
+        delays = self._delays(order, platform, DOWNLOAD_HEDGE_DELAY_SECONDS)
+        ladder = quality_ladder(platform)
+        logging.info(
+            "Download order for %s (%s): %s, hedge delays %s, quality ladder %s",
+            url,
+            platform,
+            order,
+            delays,
+            ladder,
+        )
+
+        result = await hedged_first(
+            [
+                (
+                    backend,
+                    lambda backend=backend: self.router.track(
+                        backend,
+                        platform,
+                        lambda: self._clients[backend].download(url, ladder),
+                        is_valid_download,
+                    ),
+                )
+                for backend in order
+            ],
+            delays,
+            is_valid=is_valid_download,
+            discard=discard_download,
+            operation="download",
+        )
+        if result:
+            logging.info("Download succeeded through %s", result.source)
+        else:
+            logging.warning("All download backends failed for %s", url)
+        return result
 
     async def get_video_info(self, url: str) -> VideoInfo | None:
-        logging.info("Trying Cobalt info first for %s", url)
-        cobalt_info = await self.cobalt_client.get_video_info(url)
-        if cobalt_info:
-            return cobalt_info
+        platform = platform_of(url)
+        order = self.router.order(platform)
+        return await hedged_first(
+            [(backend, lambda backend=backend: self._clients[backend].get_video_info(url)) for backend in order],
+            self._delays(order, platform, INFO_HEDGE_DELAY_SECONDS),
+            operation="info",
+        )
 
-        logging.warning("Cobalt info failed for %s, trying downloader fallback", url)
-        return await self.ytdlp_client.get_video_info(url)
+    async def get_duration(self, url: str) -> float | None:
+        info = await self.ytdlp_client.get_info(url)
+        duration = info.get("duration") if info else None
+        return float(duration) if duration else None
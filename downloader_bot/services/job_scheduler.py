@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from downloader_bot.bot.messages import MESSAGES
+from downloader_bot.config import (
+    JOB_MAX_CONCURRENT,
+    JOB_MAX_PER_CHAT,
+    JOB_QUEUE_SIZE,
+    JOB_SHORTEST_FIRST,
+    RELAY_OWNER_USER_ID,
+)
+from downloader_bot.infrastructure.metrics import metrics, percentile
+from downloader_bot.models import DeliveryTarget
+
+logger = logging.getLogger(__name__)
+
+LANE_OWNER = 0
+LANE_USERS = 1
+_LANE_NAMES = {LANE_OWNER: "owner", LANE_USERS: "users"}
+USER_WAIT_WINDOW = 100
+
+DurationEstimate = Callable[[], Awaitable[float | None]]
+
+
+@dataclass(eq=False)
+class Job:
+    target: DeliveryTarget
+    processing_message_id: int
+    user_id: int
+    lane: int
+    sequence: int
+    # Expected media duration for shortest-job-first; None until (or unless) it is known.
+    duration: float | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    admitted: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future(), repr=False)
+    # Last queue position shown in the processing message (0: never shown).
+    shown_position: int = 0
+
+
+@dataclass
+class _UserStats:
+    started: int = 0
+    shed: int = 0
+    waits: list[float] = field(default_factory=list)
+
+    def record_wait(self, seconds: float) -> None:
+        self.started += 1
+        self.waits.append(seconds)
+        del self.waits[:-USER_WAIT_WINDOW]
+
+
+class JobScheduler:
+    """Admission control for link jobs: global and per-chat concurrency, a bounded wait queue, load shedding.
+
+    Waiting jobs are ordered fairly rather than by arrival: the owner's lane first, then the users with the fewest
+    running jobs, round-robin among equals (least recently started first). With shortest-job-first on, the user
+    whose turn it is gets their shortest expected video first. Waiting jobs see their queue position in their
+    processing message; once the queue is full new jobs are refused so the caller can tell the user to retry.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        max_concurrent: int = JOB_MAX_CONCURRENT,
+        max_per_chat: int = JOB_MAX_PER_CHAT,
+        queue_size: int = JOB_QUEUE_SIZE,
+        owner_user_id: int = RELAY_OWNER_USER_ID,
+        shortest_first: bool = JOB_SHORTEST_FIRST,
+    ) -> None:
+        self.bot = bot
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_chat = max(1, max_per_chat)
+        self.queue_size = queue_size
+        self.owner_user_id = owner_user_id
+        self.shortest_first = shortest_first
+        self._waiting: list[Job] = []
+        self._running = 0
+        self._running_by_chat: dict[int, int] = {}
+        self._running_by_user: dict[int, int] = {}
+        self._last_started: dict[int, int] = {}
+        self._sequence = itertools.count(1)
+        self._starts = itertools.count(1)
+        self._user_stats: dict[int, _UserStats] = {}
+        self._edits: set[asyncio.Task] = set()
+        self._estimates: set[asyncio.Task] = set()
+
+    def _priority(self, job: Job) -> tuple:
+        duration = 0.0
+        if self.shortest_first:
+            duration = job.duration if job.duration is not None else math.inf
+        return (
+            job.lane,
+            self._running_by_user.get(job.user_id, 0),
+            self._last_started.get(job.user_id, 0),
+            duration,
+            job.sequence,
+        )
+
+    def _queue_order(self) -> list[Job]:
+        return sorted(self._waiting, key=self._priority)
+
+    def _can_start(self, job: Job) -> bool:
+        return (
+            self._running < self.max_concurrent
+            and self._running_by_chat.get(job.target.chat_id, 0) < self.max_per_chat
+        )
+
+    def _start(self, job: Job) -> None:
+        self._running += 1
+        self._running_by_chat[job.target.chat_id] = self._running_by_chat.get(job.target.chat_id, 0) + 1
+        self._running_by_user[job.user_id] = self._running_by_user.get(job.user_id, 0) + 1
+        self._last_started[job.user_id] = next(self._starts)
+        job.admitted.set_result(None)
+
+    @staticmethod
+    def _decrement(counts: dict[int, int], key: int) -> None:
+        remaining = counts[key] - 1
+        if remaining:
+            counts[key] = remaining
+        else:
+            del counts[key]
+
+    def _finish(self, job: Job) -> None:
+        self._running -= 1
+        self._decrement(self._running_by_chat, job.target.chat_id)
+        self._decrement(self._running_by_user, job.user_id)
+
+    def _admit_waiting(self) -> None:
+        # Re-rank after every start: a started job changes its user's running count.
+        while self._running < self.max_concurrent:
+            job = next((job for job in self._queue_order() if self._can_start(job)), None)
+            if job is None:
+                break
+            self._waiting.remove(job)
+            self._start(job)
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set("job_queue_depth", len(self._waiting))
+        metrics.set("jobs_running", self._running)
+        for position, job in enumerate(self._queue_order(), 1):
+            if job.shown_position != position:
+                job.shown_position = position
+                self._edit_processing_message(job, MESSAGES["queued"].format(position))
+
+    def _edit_processing_message(self, job: Job, text: str) -> None:
+        task = asyncio.create_task(self._edit_quietly(job, text))
+        self._edits.add(task)
+        task.add_done_callback(self._edits.discard)
+
+    async def _edit_quietly(self, job: Job, text: str) -> None:
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=job.target.chat_id,
+                message_id=job.processing_message_id,
+            )
+        except TelegramBadRequest as exc:
+            logger.debug("Could not update queued message: %s", exc)
+
+    async def _estimate_duration(self, job: Job, estimate: DurationEstimate) -> None:
+        try:
+            job.duration = await estimate()
+        except Exception as exc:
+            logger.warning("Duration estimate failed for chat=%s: %s", job.target.chat_id, exc)
+            return
+        if job in self._waiting:
+            self._publish()
+
+    def _stats(self, user_id: int) -> _UserStats:
+        stats = self._user_stats.get(user_id)
+        if stats is None:
+            stats = self._user_stats[user_id] = _UserStats()
+        return stats
+
+    def _lane(self, user_id: int) -> int:
+        return LANE_OWNER if self.owner_user_id and user_id == self.owner_user_id else LANE_USERS
+
+    def _shed(self, target: DeliveryTarget, user_id: int) -> None:
+        self._stats(user_id).shed += 1
+        metrics.inc("jobs_shed")
+        logger.warning(
+            "Job queue full (%s waiting, %s running) — refusing chat=%s",
+            len(self._waiting),
+            self._running,
+            target.chat_id,
+        )
+
+    def refuses(self, target: DeliveryTarget, user_id: int = 0) -> bool:
+        """True, counted as shed, when a job from ``user_id`` would be refused right now.
+
+        Lets a link that will only need a slot later (after a relay wait) be turned away when it is submitted.
+        """
+        if self._lane(user_id) == LANE_OWNER or len(self._waiting) < self.queue_size:
+            return False
+        self._shed(target, user_id)
+        return True
+
+    async def acquire(
+        self,
+        target: DeliveryTarget,
+        processing_message_id: int,
+        user_id: int = 0,
+        estimate: DurationEstimate | None = None,
+    ) -> Job | None:
+        """Wait for a slot and return it, or None (without waiting) when the wait queue is full.
+
+        The caller must ``release`` the returned job. ``estimate`` is only awaited for jobs that have to wait and
+        only with shortest-job-first enabled.
+        """
+        lane = self._lane(user_id)
+        job = Job(
+            target=target,
+            processing_message_id=processing_message_id,
+            user_id=user_id,
+            lane=lane,
+            sequence=next(self._sequence),
+        )
+        # Waiting jobs only wait on limits, so one that fits now is not jumping a queue it could join.
+        if self._can_start(job):
+            self._start(job)
+        elif len(self._waiting) >= self.queue_size and lane != LANE_OWNER:
+            self._shed(target, user_id)
+            return None
+        else:
+            self._waiting.append(job)
+            logger.info(
+                "Job queued for chat=%s user=%s lane=%s, %s waiting",
+                target.chat_id,
+                user_id,
+                _LANE_NAMES[lane],
+                len(self._waiting),
+            )
+            if self.shortest_first and estimate is not None:
+                task = asyncio.create_task(self._estimate_duration(job, estimate))
+                self._estimates.add(task)
+                task.add_done_callback(self._estimates.discard)
+            self._publish()
+            try:
+                await job.admitted
+            except asyncio.CancelledError:
+                if job in self._waiting:
+                    self._waiting.remove(job)
+                    self._publish()
+                    raise
+                self.release(job)
+                raise
+            if job.shown_position:
+                self._edit_processing_message(job, MESSAGES["processing"])
+
+        wait_seconds = time.monotonic() - job.enqueued_at
+        self._stats(user_id).record_wait(wait_seconds)
+        metrics.observe("job_queue_wait_seconds", wait_seconds, lane=_LANE_NAMES[lane])
+        return job
+
+    def release(self, job: Job) -> None:
+        self._finish(job)
+        self._admit_waiting()
+
+    def snapshot(self) -> dict[str, object]:
+        now = time.monotonic()
+        return {
+            "running": self._running,
+            "waiting": len(self._waiting),
+            "queue_size": self.queue_size,
+            "oldest_wait_seconds": round(max((now - job.enqueued_at for job in self._waiting), default=0.0), 2),
+            "running_by_chat": dict(self._running_by_chat),
+            "users": {
+                user_id: {
+                    "started": stats.started,
+                    "shed": stats.shed,
+                    "running": self._running_by_user.get(user_id, 0),
+                    "waiting": sum(1 for job in self._waiting if job.user_id == user_id),
+                    "wait_p50": percentile(stats.waits, 0.5),
+                    "wait_p95": percentile(stats.waits, 0.95),
+                }
+                for user_id, stats in self._user_stats.items()
+            },
+        }
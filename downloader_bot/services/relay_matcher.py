@@ -0,0 +1,122 @@
+import re
+from collections.abc import Iterator
+from typing import Generic, Protocol, TypeVar
+
+from aiogram.types import Message
+
+from downloader_bot.canonical_url import URL_PATTERN
+from downloader_bot.infrastructure.file_id_cache import make_cache_key
+
+RELAY_TAG_PATTERN = re.compile(r"#relay(\d+)\b")
+
+EVIDENCE_TAG = "tag"
+EVIDENCE_REPLY = "reply"
+EVIDENCE_URL = "url"
+EVIDENCE_DURATION = "duration"
+EVIDENCE_FIFO = "fifo"
+
+DURATION_TOLERANCE_SECONDS = 2.0
+DURATION_TOLERANCE_FRACTION = 0.05
+
+
+class Correlatable(Protocol):
+    cache_key: str
+    relay_message_id: int | None
+    expected_duration: float | None
+    retired: bool
+
+
+P = TypeVar("P", bound=Correlatable)
+
+
+def relay_tags_in(message: Message) -> list[int]:
+    """Relay message ids the business bot tagged its copy with."""
+    return [int(match) for match in RELAY_TAG_PATTERN.findall(message.caption or "")]
+
+
+def echoed_cache_keys(message: Message) -> set[str]:
+    text = message.caption or message.text or ""
+    urls = URL_PATTERN.findall(text)
+    for entity in message.caption_entities or message.entities or []:
+        if entity.type == "text_link" and entity.url:
+            urls.append(entity.url)
+    return {make_cache_key(url) for url in urls}
+
+
+def _duration_matches(expected: float, actual: float) -> bool:
+    return abs(expected - actual) <= max(DURATION_TOLERANCE_SECONDS, expected * DURATION_TOLERANCE_FRACTION)
+
+
+class RelayMatcher(Generic[P]):
+    """Pending relays indexed by the evidence a relayed video can carry back.
+
+    Evidence is tried strongest first: the ``#relay<id>`` caption tag or reply to the relay message, an echo of
+    the source URL in the caption, then a unique duration match. Only a video carrying none of these falls back
+    to the oldest pending relay. A video that names a relay id which is no longer pending is a late or duplicate
+    answer and matches nothing. Retired relays (already served locally) are kept only to absorb their own late
+    video, so they match by tag, reply or URL but never by duration or FIFO.
+    """
+
+    def __init__(self) -> None:
+        # Insertion-ordered, so iteration is oldest first.
+        self._pending: dict[int, P] = {}
+        self._by_relay_id: dict[int, P] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __iter__(self) -> Iterator[P]:
+        return iter(list(self._pending.values()))
+
+    def add(self, pending: P) -> None:
+        self._pending[id(pending)] = pending
+        if pending.relay_message_id is not None:
+            self._by_relay_id[pending.relay_message_id] = pending
+
+    def remove(self, pending: P) -> bool:
+        if self._pending.pop(id(pending), None) is None:
+            return False
+        if pending.relay_message_id is not None and self._by_relay_id.get(pending.relay_message_id) is pending:
+            del self._by_relay_id[pending.relay_message_id]
+        return True
+
+    def find(self, message: Message) -> tuple[P, str] | None:
+        tags = relay_tags_in(message)
+        for relay_id in tags:
+            pending = self._by_relay_id.get(relay_id)
+            if pending is not None:
+                return pending, EVIDENCE_TAG
+        if tags:
+            return None
+        if message.reply_to_message:
+            pending = self._by_relay_id.get(message.reply_to_message.message_id)
+            if pending is not None:
+                return pending, EVIDENCE_REPLY
+
+        cache_keys = echoed_cache_keys(message)
+        if cache_keys:
+            for pending in self._pending.values():
+                if pending.cache_key in cache_keys:
+                    return pending, EVIDENCE_URL
+
+        media = message.video or message.document or message.animation
+        duration = getattr(media, "duration", None)
+        if duration:
+            candidates = [
+                pending
+                for pending in self._pending.values()
+                if not pending.retired
+                and pending.expected_duration
+                and _duration_matches(pending.expected_duration, duration)
+            ]
+            if len(candidates) == 1:
+                return candidates[0], EVIDENCE_DURATION
+
+        oldest = next((pending for pending in self._pending.values() if not pending.retired), None)
+        return (oldest, EVIDENCE_FIFO) if oldest is not None else None
+
+    def pop(self, message: Message) -> tuple[P, str] | None:
+        found = self.find(message)
+        if found is not None:
+            self.remove(found[0])
+        return found
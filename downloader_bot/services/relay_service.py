@@ -1,6 +1,7 @@
 import asyncio
 import logging
-from collections import deque
+import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
 
 from aiogram import Bot
@@ -9,28 +10,96 @@ from aiogram.types import Message
 
 from downloader_bot.bot.messages import MESSAGES
 from downloader_bot.clients.business_relay_client import BusinessRelayClient
-from downloader_bot.config import RELAY_OWNER_USER_ID, RELAY_TIMEOUT_SECONDS
+from downloader_bot.config import (
+    RELAY_DURATION_HINTS,
+    RELAY_OWNER_USER_ID,
+    RELAY_RACE_PLATFORMS,
+    RELAY_SPECULATIVE_DOWNLOAD,
+)
+from downloader_bot.infrastructure.file_id_cache import FileIdCache, make_cache_key
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.infrastructure.relay_ledger import RelayLedger, RelayRecord
+from downloader_bot.infrastructure.single_flight import SingleFlight
 from downloader_bot.infrastructure.temp_files import cleanup_temp_dir
-from downloader_bot.services.download_service import DownloadService
-from downloader_bot.services.video_delivery import VideoDeliveryService
+from downloader_bot.models import CachedMedia, DeliveryTarget, DownloadResult
+from downloader_bot.services.download_service import DownloadService, discard_download, platform_of
+from downloader_bot.services.job_scheduler import Job, JobScheduler
+from downloader_bot.services.relay_matcher import RelayMatcher, relay_tags_in
+from downloader_bot.services.relay_timeout import RelayLatencyModel
+from downloader_bot.services.video_delivery import VideoDeliveryService, cached_media_from_message
 
 logger = logging.getLogger(__name__)
 
 MAX_CAPTION_LENGTH = 1024
-
-
-def is_group_origin(message: Message) -> bool:
-    return message.chat.type in ("group", "supergroup")
+# Timed-out relays remembered so a late answer still contributes its latency.
+EXPIRED_RELAYS_REMEMBERED = 256
 
 
 @dataclass
 class PendingRelay:
-    message: Message
+    target: DeliveryTarget
     url: str
     user_mention: str
     processing_message_id: int
+    cache_key: str = ""
+    # Requesting user for fair job scheduling; 0 for relays restored from the ledger, which does not store it.
+    user_id: int = 0
+    relay_message_id: int | None = None
+    created_at: float = field(default_factory=time.time)
+    deadline: float = 0.0
+    ledger_id: int | None = None
+    expected_duration: float | None = None
     matched: bool = field(default=False)
+    # Answered by a local download that won the race; stays in the matcher until its deadline so a late relay
+    # video is recognised and dropped instead of being matched to another request.
+    retired: bool = field(default=False)
     fallback_task: asyncio.Task | None = field(default=None, repr=False)
+    # Speculative local download started before the deadline, reused by the fallback.
+    warm_download: asyncio.Task[DownloadResult | None] | None = field(default=None, repr=False)
+    # Job slot held from the start of the local download until its delivery finishes.
+    job: Job | None = field(default=None, repr=False)
+    # The local download was refused because the job queue was full.
+    shed: bool = field(default=False)
+    # Resolved with the delivered file_ids ([] on failure) so coalesced requests can reuse them, or with None when
+    # the delivery succeeded without a reusable file_id and each coalesced request has to run its own.
+    outcome: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future(), repr=False)
+
+    @property
+    def platform(self) -> str:
+        return platform_of(self.url)
+
+    @property
+    def job_user_id(self) -> int:
+        return self.user_id or self.target.chat_id
+
+    def resolve(self, parts: list[CachedMedia] | None) -> None:
+        if not self.outcome.done():
+            self.outcome.set_result(parts)
+
+    def to_record(self) -> RelayRecord:
+        return RelayRecord(
+            target=self.target,
+            url=self.url,
+            user_mention=self.user_mention,
+            processing_message_id=self.processing_message_id,
+            relay_message_id=self.relay_message_id,
+            created_at=self.created_at,
+            deadline=self.deadline,
+        )
+
+    @classmethod
+    def from_record(cls, record: RelayRecord) -> "PendingRelay":
+        return cls(
+            target=record.target,
+            url=record.url,
+            user_mention=record.user_mention,
+            processing_message_id=record.processing_message_id,
+            cache_key=make_cache_key(record.url),
+            relay_message_id=record.relay_message_id,
+            created_at=record.created_at,
+            deadline=record.deadline,
+            ledger_id=record.ledger_id,
+        )
 
 
 class RelayService:
@@ -39,158 +108,427 @@ class RelayService:
         bot: Bot,
         download_service: DownloadService,
         delivery_service: VideoDeliveryService,
-        business_client: BusinessRelayClient | None = None,
+        business_client: BusinessRelayClient,
+        file_id_cache: FileIdCache,
+        ledger: RelayLedger,
+        job_scheduler: JobScheduler,
     ) -> None:
         self.bot = bot
         self.download_service = download_service
         self.delivery_service = delivery_service
-        self.business_client = business_client or BusinessRelayClient()
-        self._queue: deque[PendingRelay] = deque()
+        self.business_client = business_client
+        self.file_id_cache = file_id_cache
+        self.ledger = ledger
+        self.job_scheduler = job_scheduler
+        self.latency = RelayLatencyModel(ledger)
+        # relay message id → (platform, sent at) of relays that timed out.
+        self._expired: OrderedDict[int, tuple[str, float]] = OrderedDict()
+        self._relays: RelayMatcher[PendingRelay] = RelayMatcher()
         self._lock = asyncio.Lock()
+        self._flights: SingleFlight[list[CachedMedia] | None] = SingleFlight()
+        self._background: set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def restore(self) -> None:
+        """Re-arm relays persisted before a restart; ones whose deadline passed meanwhile fall back at once."""
+        now = time.time()
+        for record in self.ledger.load():
+            pending = PendingRelay.from_record(record)
+            if pending.deadline <= now:
+                logger.warning(
+                    "Relay for url=%s chat=%s expired during downtime — fallback download",
+                    pending.url,
+                    pending.target.chat_id,
+                )
+                metrics.inc("relay_restored", state="expired")
+                self._remember_expired(pending)
+                self._spawn(self._run_fallback(pending))
+                continue
+            async with self._lock:
+                self._relays.add(pending)
+            pending.fallback_task = asyncio.create_task(self._fallback_after_timeout(pending))
+            metrics.inc("relay_restored", state="pending")
+            logger.info(
+                "Restored relay url=%s chat=%s, %.0fs left",
+                pending.url,
+                pending.target.chat_id,
+                pending.deadline - now,
+            )
 
     async def submit(
         self,
-        message: Message,
+        target: DeliveryTarget,
         url: str,
         user_mention: str,
         processing_message_id: int,
+        user_id: int = 0,
     ) -> None:
         pending = PendingRelay(
-            message=message,
+            target=target,
             url=url,
             user_mention=user_mention,
             processing_message_id=processing_message_id,
+            cache_key=make_cache_key(url),
+            user_id=user_id,
         )
 
-        if RELAY_OWNER_USER_ID and not is_group_origin(message):
+        cached_parts = self.file_id_cache.get(pending.cache_key)
+        if cached_parts and await self._deliver_cached(pending, cached_parts):
+            return
+
+        if not self._flights.in_flight(pending.cache_key) and self.job_scheduler.refuses(target, pending.job_user_id):
+            # Refuse up front rather than after a relay wait that may end in a local download.
+            await self.delivery_service.send_message_to_chat(target, MESSAGES["queue_full"])
+            await self._delete_processing_message(pending)
+            return
+
+        if self._flights.in_flight(pending.cache_key):
+            metrics.inc("relay_coalesced_requests")
+            logger.info(
+                "Joining in-flight job for url=%s chat=%s waiters=%s",
+                url,
+                target.chat_id,
+                self._flights.waiters(pending.cache_key),
+            )
+
+        parts, joined = await self._flights.run(pending.cache_key, lambda: self._process(pending))
+        if not joined:
+            return
+        if parts is None:
+            logger.info(
+                "Shared delivery of url=%s left no reusable file_id — relaying again for chat=%s",
+                url,
+                target.chat_id,
+            )
+            await self._process(pending)
+            return
+        if parts and await self._deliver_cached(pending, parts):
+            return
+        await self.delivery_service.send_message_to_chat(target, MESSAGES["error_download"])
+        await self._delete_processing_message(pending)
+
+    async def _process(self, pending: PendingRelay) -> list[CachedMedia] | None:
+        target = pending.target
+        url = pending.url
+        if RELAY_OWNER_USER_ID and not target.is_group:
             try:
                 await self.bot.send_message(
                     chat_id=RELAY_OWNER_USER_ID,
-                    text=format_owner_relay_message(url, user_mention, message.chat.id),
+                    text=format_owner_relay_message(url, pending.user_mention, target.chat_id),
                 )
             except TelegramBadRequest as exc:
                 logger.warning("Could not notify owner %s: %s", RELAY_OWNER_USER_ID, exc)
 
-        relay_ok = await self.business_client.send_url(url)
-        if not relay_ok:
+        pending.created_at = time.time()
+        receipt = await self.business_client.send_url(url)
+        if receipt is None:
             logger.warning("Business relay failed for url=%s — immediate fallback", url)
             await self._run_fallback(pending)
-            return
+            return await pending.outcome
 
+        pending.relay_message_id = receipt.message_id
+        pending.deadline = pending.created_at + self.latency.timeout(pending.platform)
+        pending.ledger_id = self.ledger.add(pending.to_record())
         async with self._lock:
-            self._queue.append(pending)
+            self._relays.add(pending)
         pending.fallback_task = asyncio.create_task(self._fallback_after_timeout(pending))
+        if RELAY_DURATION_HINTS:
+            self._spawn(self._fetch_duration_hint(pending))
+        if pending.platform in RELAY_RACE_PLATFORMS:
+            pending.warm_download = asyncio.create_task(self._download_in_slot(pending))
+            self._spawn(self._race_local_download(pending, pending.warm_download))
         logger.info(
-            "Relay enqueued url=%s chat=%s queue_size=%s",
+            "Relay enqueued url=%s chat=%s relay_msg_id=%s timeout=%.0fs queue_size=%s",
             url,
-            message.chat.id,
-            len(self._queue),
+            target.chat_id,
+            receipt.message_id,
+            pending.deadline - pending.created_at,
+            len(self._relays),
         )
+        return await asyncio.shield(pending.outcome)
+
+    async def _fetch_duration_hint(self, pending: PendingRelay) -> None:
+        duration = await self.download_service.get_duration(pending.url)
+        if duration and not pending.matched:
+            pending.expected_duration = duration
 
     async def handle_owner_video(self, message: Message) -> bool:
         async with self._lock:
-            if not self._queue:
+            if not self._relays:
+                self._observe_late_answer(message)
                 logger.info("Relay skip owner video: empty queue msg_id=%s", message.message_id)
                 return False
-            pending = self._queue.popleft()
+            found = self._relays.pop(message)
+            if found is not None and not found[0].retired:
+                found[0].matched = True
+        if found is None:
+            self._observe_late_answer(message)
+            metrics.inc("relay_unmatched_videos")
+            logger.info(
+                "Relay skip owner video msg_id=%s: no pending relay matches it",
+                message.message_id,
+            )
+            return False
 
-        pending.matched = True
+        pending, evidence = found
+        self.latency.observe(pending.platform, time.time() - pending.created_at)
+        if pending.retired:
+            metrics.inc("relay_race_late_videos", platform=pending.platform)
+            logger.info(
+                "Relay video msg_id=%s for url=%s (matched by %s) arrived after the local download won — discarded",
+                message.message_id,
+                pending.url,
+                evidence,
+            )
+            if pending.target.is_group:
+                await self._delete_owner_copy(message)
+            return True
+
+        self.ledger.remove(pending.ledger_id)
+        metrics.inc("relay_matches", evidence=evidence)
+        logger.info("Relay video msg_id=%s matched url=%s by %s", message.message_id, pending.url, evidence)
+        if pending.platform in RELAY_RACE_PLATFORMS:
+            metrics.inc("relay_race_wins", platform=pending.platform, winner="relay")
         if pending.fallback_task and not pending.fallback_task.done():
             pending.fallback_task.cancel()
 
         caption = build_relay_caption(pending.user_mention, pending.url)
         try:
             await self.bot.copy_message(
-                chat_id=pending.message.chat.id,
+                chat_id=pending.target.chat_id,
                 from_chat_id=message.chat.id,
                 message_id=message.message_id,
                 caption=caption,
-                message_thread_id=pending.message.message_thread_id,
+                message_thread_id=pending.target.thread_id,
             )
         except TelegramBadRequest as exc:
             logger.error("Relay copy_message failed: %s — running fallback", exc)
             await self._run_fallback(pending)
             return True
 
+        self._discard_warm_download(pending)
+        cached = cached_media_from_message(message)
+        if cached:
+            self.file_id_cache.put(pending.cache_key, [cached])
+        pending.resolve([cached] if cached else None)
         await self._cleanup_after_success(pending)
 
-        if is_group_origin(pending.message):
-            try:
-                await message.delete()
-            except TelegramBadRequest as exc:
-                logger.warning("Could not delete relay video from owner DM: %s", exc)
+        if pending.target.is_group:
+            await self._delete_owner_copy(message)
 
-        logger.info("Relay delivered url=%s to chat=%s", pending.url, pending.message.chat.id)
+        logger.info("Relay delivered url=%s to chat=%s", pending.url, pending.target.chat_id)
         return True
 
-    async def _fallback_after_timeout(self, pending: PendingRelay) -> None:
+    def _observe_late_answer(self, message: Message) -> None:
+        for relay_id in relay_tags_in(message):
+            expired = self._expired.pop(relay_id, None)
+            if expired:
+                platform, sent_at = expired
+                self.latency.observe(platform, time.time() - sent_at)
+                metrics.inc("relay_late_answers", platform=platform)
+
+    async def _race_local_download(self, pending: PendingRelay, download: asyncio.Task) -> None:
         try:
-            await asyncio.sleep(RELAY_TIMEOUT_SECONDS)
+            result = await download
         except asyncio.CancelledError:
             return
+        except Exception as exc:
+            logger.warning("Racing local download failed for url=%s: %s", pending.url, exc)
+            result = None
 
         async with self._lock:
+            # A relay video that already matched now owns the download (it discards or reuses it).
             if pending.matched:
                 return
-            try:
-                self._queue.remove(pending)
-            except ValueError:
+            if result is None:
+                pending.warm_download = None
+                self._release_job(pending)
+                logger.info("Racing local download found nothing for url=%s — waiting for the relay", pending.url)
+                return
+            pending.retired = True
+        metrics.inc("relay_race_wins", platform=pending.platform, winner="local")
+        logger.info("Local download won the race for url=%s", pending.url)
+        self._spawn(self._drop_retired(pending))
+        await self._run_fallback(pending)
+
+    async def _drop_retired(self, pending: PendingRelay) -> None:
+        await asyncio.sleep(max(0.0, pending.deadline - time.time()))
+        async with self._lock:
+            self._relays.remove(pending)
+
+    def _remember_expired(self, pending: PendingRelay) -> None:
+        if pending.relay_message_id is None:
+            return
+        self._expired[pending.relay_message_id] = (pending.platform, pending.created_at)
+        while len(self._expired) > EXPIRED_RELAYS_REMEMBERED:
+            self._expired.popitem(last=False)
+
+    def _speculation_start(self, pending: PendingRelay) -> float | None:
+        if not RELAY_SPECULATIVE_DOWNLOAD or pending.warm_download is not None:
+            return None
+        median = self.latency.median(pending.platform)
+        if median is None or pending.created_at + median >= pending.deadline:
+            return None
+        return pending.created_at + median
+
+    def _discard_warm_download(self, pending: PendingRelay) -> None:
+        task, pending.warm_download = pending.warm_download, None
+        if task is not None:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None and task.result():
+                discard_download(task.result())
+        self._release_job(pending)
+
+    async def _download_in_slot(self, pending: PendingRelay) -> DownloadResult | None:
+        """Local download under the request's job slot, which stays held until ``_release_job``."""
+        if pending.job is None:
+            pending.job = await self.job_scheduler.acquire(
+                pending.target,
+                pending.processing_message_id,
+                user_id=pending.job_user_id,
+                estimate=lambda: self.download_service.get_duration(pending.url),
+            )
+            pending.shed = pending.job is None
+            if pending.shed:
+                return None
+        return await self.download_service.download(pending.url)
+
+    def _release_job(self, pending: PendingRelay) -> None:
+        job, pending.job = pending.job, None
+        if job is not None:
+            self.job_scheduler.release(job)
+
+    async def _fallback_after_timeout(self, pending: PendingRelay) -> None:
+        try:
+            speculate_at = self._speculation_start(pending)
+            if speculate_at is not None:
+                await asyncio.sleep(max(0.0, speculate_at - time.time()))
+                logger.info("Relay for url=%s is slower than median — starting local download", pending.url)
+                metrics.inc("relay_speculative_downloads", platform=pending.platform)
+                pending.warm_download = asyncio.create_task(self._download_in_slot(pending))
+            await asyncio.sleep(max(0.0, pending.deadline - time.time()))
+        except asyncio.CancelledError:
+            return
+
+        async with self._lock:
+            if pending.matched or not self._relays.remove(pending):
                 return
+        self._remember_expired(pending)
 
         logger.warning(
-            "Relay timeout after %ss for url=%s chat=%s — fallback download",
-            RELAY_TIMEOUT_SECONDS,
+            "Relay timeout after %.0fs for url=%s chat=%s — fallback download",
+            time.time() - pending.created_at,
             pending.url,
-            pending.message.chat.id,
+            pending.target.chat_id,
         )
         await self._run_fallback(pending)
 
     async def _run_fallback(self, pending: PendingRelay) -> None:
         pending.matched = True
-        if pending.fallback_task and not pending.fallback_task.done():
+        # The timeout task runs the fallback itself and must not cancel its own download.
+        if (
+            pending.fallback_task
+            and not pending.fallback_task.done()
+            and pending.fallback_task is not asyncio.current_task()
+        ):
             pending.fallback_task.cancel()
 
-        video_dir = None
         try:
-            result = await self.download_service.download(pending.url)
-            if result:
-                video_dir = result.temp_dir
-                caption = f"{MESSAGES['success'].format(result.filename)}\n{pending.user_mention}\n{pending.url}"
-                await self.delivery_service.handle_video_sending(
-                    pending.message,
-                    result.local_path,
-                    caption,
-                    result.temp_dir,
-                    pending.user_mention,
-                    pending.url,
-                )
-                await pending.message.delete()
-            else:
-                await self.delivery_service.send_message_to_chat(
-                    pending.message,
-                    MESSAGES["error_download"],
-                )
+            await self._download_and_deliver(pending)
         except Exception as exc:
             logger.exception("Relay fallback failed for url=%s: %s", pending.url, exc)
             await self.delivery_service.send_message_to_chat(
-                pending.message,
+                pending.target,
                 MESSAGES["error_download"],
             )
         finally:
+            # Waiting on the relay costs nothing locally; only the download and upload hold the job slot.
+            self._release_job(pending)
+            self.ledger.remove(pending.ledger_id)
+            pending.resolve([])
             await self._delete_processing_message(pending)
+
+    async def _download_and_deliver(self, pending: PendingRelay) -> None:
+        video_dir = None
+        try:
+            if pending.warm_download is not None:
+                download, pending.warm_download = pending.warm_download, None
+                result = await download
+            else:
+                result = await self._download_in_slot(pending)
+            if pending.shed:
+                await self.delivery_service.send_message_to_chat(pending.target, MESSAGES["queue_full"])
+                return
+            if not result:
+                await self.delivery_service.send_message_to_chat(
+                    pending.target,
+                    MESSAGES["error_download"],
+                )
+                return
+            video_dir = result.temp_dir
+            caption = f"{MESSAGES['success'].format(result.filename)}\n{pending.user_mention}\n{pending.url}"
+            sent_parts = await self.delivery_service.handle_video_sending(
+                pending.target,
+                result.local_path,
+                caption,
+                result.temp_dir,
+                pending.user_mention,
+                pending.url,
+            )
+            if sent_parts:
+                self.file_id_cache.put(pending.cache_key, sent_parts)
+            # None (delivered, nothing reusable) sends coalesced requests through their own delivery.
+            pending.resolve(sent_parts)
+            await self._delete_user_message(pending)
+        finally:
             cleanup_temp_dir(video_dir)
 
+    async def _deliver_cached(self, pending: PendingRelay, parts: list[CachedMedia]) -> bool:
+        pending.matched = True
+        try:
+            await self.delivery_service.send_cached_media(
+                pending.target,
+                parts,
+                build_relay_caption(pending.user_mention, pending.url),
+                pending.user_mention,
+                pending.url,
+            )
+        except TelegramBadRequest as exc:
+            logger.warning("Cached file_id rejected for url=%s: %s — downloading again", pending.url, exc)
+            self.file_id_cache.invalidate(pending.cache_key)
+            pending.matched = False
+            return False
+
+        await self._cleanup_after_success(pending)
+        logger.info("Delivered url=%s from file_id cache to chat=%s", pending.url, pending.target.chat_id)
+        return True
+
     async def _cleanup_after_success(self, pending: PendingRelay) -> None:
+        await self._delete_user_message(pending)
+        await self._delete_processing_message(pending)
+
+    @staticmethod
+    async def _delete_owner_copy(message: Message) -> None:
         try:
-            await pending.message.delete()
+            await message.delete()
+        except TelegramBadRequest as exc:
+            logger.warning("Could not delete relay video from owner DM: %s", exc)
+
+    async def _delete_user_message(self, pending: PendingRelay) -> None:
+        try:
+            await self.bot.delete_message(pending.target.chat_id, pending.target.message_id)
         except TelegramBadRequest as exc:
             logger.warning("Could not delete user message: %s", exc)
-        await self._delete_processing_message(pending)
 
     async def _delete_processing_message(self, pending: PendingRelay) -> None:
         try:
             await self.bot.delete_message(
-                pending.message.chat.id,
+                pending.target.chat_id,
                 pending.processing_message_id,
             )
         except TelegramBadRequest as exc:
@@ -0,0 +1,67 @@
+from collections import deque
+
+from downloader_bot.config import (
+    RELAY_LATENCY_WINDOW,
+    RELAY_TIMEOUT_MARGIN,
+    RELAY_TIMEOUT_MAX_SECONDS,
+    RELAY_TIMEOUT_MIN_SAMPLES,
+    RELAY_TIMEOUT_MIN_SECONDS,
+    RELAY_TIMEOUT_PERCENTILE,
+    RELAY_TIMEOUT_SECONDS,
+)
+from downloader_bot.infrastructure.metrics import metrics, percentile
+from downloader_bot.infrastructure.relay_ledger import RelayLedger
+
+
+class RelayLatencyModel:
+    """Per-platform relay round-trip latencies and the timeouts derived from them.
+
+    A platform's timeout is a high percentile of its recent latencies times a safety margin, clamped to the
+    configured bounds; platforms with too few samples use the fixed ``RELAY_TIMEOUT_SECONDS``.
+    """
+
+    def __init__(
+        self,
+        ledger: RelayLedger,
+        default_timeout: float = RELAY_TIMEOUT_SECONDS,
+        window: int = RELAY_LATENCY_WINDOW,
+    ) -> None:
+        self.ledger = ledger
+        self.default_timeout = default_timeout
+        self.window = window
+        self._samples: dict[str, deque[float]] = {
+            platform: deque(values, maxlen=window) for platform, values in ledger.load_latencies().items()
+        }
+
+    def observe(self, platform: str, seconds: float) -> None:
+        self._samples.setdefault(platform, deque(maxlen=self.window)).append(seconds)
+        self.ledger.add_latency(platform, seconds, self.window)
+        metrics.observe("relay_latency_seconds", seconds, platform=platform)
+
+    def _learned(self, platform: str) -> list[float] | None:
+        samples = self._samples.get(platform)
+        if not samples or len(samples) < RELAY_TIMEOUT_MIN_SAMPLES:
+            return None
+        return list(samples)
+
+    def timeout(self, platform: str) -> float:
+        samples = self._learned(platform)
+        if samples is None:
+            return self.default_timeout
+        learned = percentile(samples, RELAY_TIMEOUT_PERCENTILE) * RELAY_TIMEOUT_MARGIN
+        return min(RELAY_TIMEOUT_MAX_SECONDS, max(RELAY_TIMEOUT_MIN_SECONDS, learned))
+
+    def median(self, platform: str) -> float | None:
+        samples = self._learned(platform)
+        return percentile(samples, 0.5) if samples else None
+
+    def snapshot(self) -> dict[str, dict[str, float | int | None]]:
+        return {
+            platform: {
+                "samples": len(samples),
+                "p50": percentile(list(samples), 0.5),
+                "p95": percentile(list(samples), 0.95),
+                "timeout": round(self.timeout(platform), 1),
+            }
+            for platform, samples in self._samples.items()
+        }
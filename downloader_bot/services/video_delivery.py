@@ -1,138 +1,522 @@
+import asyncio
 import logging
 import os
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+from typing import TypeVar
 
 from aiogram import Bot
-from aiogram.types import FSInputFile, Message
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import FSInputFile, InputMediaDocument, InputMediaVideo, Message
 
 from downloader_bot.bot.messages import MESSAGES
-from downloader_bot.config import MAX_SINGLE_FILE_SIZE, MAX_TOTAL_FILE_SIZE
-from downloader_bot.media.ffmpeg import bytes_to_mb, create_thumbnail, split_video_with_ffmpeg
+from downloader_bot.config import (
+    FIT_TRANSCODE,
+    MAX_SINGLE_FILE_SIZE,
+    MAX_TOTAL_FILE_SIZE,
+    PART_UPLOAD_CONCURRENCY,
+    PART_UPLOAD_MODE,
+    PART_UPLOAD_STAGING_CHAT_ID,
+    SPLIT_LOOKAHEAD_PARTS,
+    TELEGRAM_API_LOCAL,
+    TELEGRAM_FLOOD_RETRIES,
+)
+from downloader_bot.infrastructure.adaptive_limiter import AimdLimiter
+from downloader_bot.infrastructure.metrics import metrics
+from downloader_bot.infrastructure.pipeline import prefetch
+from downloader_bot.media.ffmpeg import (
+    SplitError,
+    SplitProgress,
+    bytes_to_mb,
+    create_thumbnail,
+    ensure_faststart,
+    fit_video_to_size,
+    iter_video_parts,
+    remove_video_part,
+)
+from downloader_bot.models import CachedMedia, DeliveryTarget, VideoPart
+
+
+T = TypeVar("T")
+
+ALBUM_MAX_ITEMS = 10
+
+
+def input_file(path: str) -> FSInputFile | str:
+    """A local Bot API server reads the file from the shared volume; the cloud API needs a multipart upload."""
+    if TELEGRAM_API_LOCAL:
+        return Path(path).resolve().as_uri()
+    return FSInputFile(path)
+
+
+def cached_media_from_message(message: Message) -> CachedMedia | None:
+    if message.video:
+        return CachedMedia(kind="video", file_id=message.video.file_id)
+    if message.document:
+        return CachedMedia(kind="document", file_id=message.document.file_id)
+    if message.animation:
+        return CachedMedia(kind="animation", file_id=message.animation.file_id)
+    return None
+
+
+def delivered_parts(sent_parts: list[CachedMedia], total: int) -> list[CachedMedia] | None:
+    """``sent_parts`` when every one of ``total`` parts left a file_id, None when some did not, [] if none were cut."""
+    if not total:
+        return []
+    return sent_parts if len(sent_parts) == total else None
+
+
+def delivery_target(message: Message) -> DeliveryTarget:
+    return DeliveryTarget(
+        chat_id=message.chat.id,
+        thread_id=message.message_thread_id,
+        message_id=message.message_id,
+        chat_type=message.chat.type,
+    )
+
+
+def video_metadata(duration: float | None, width: int | None, height: int | None) -> dict[str, int]:
+    metadata = {}
+    if duration:
+        metadata["duration"] = round(duration)
+    if width and height:
+        metadata["width"] = width
+        metadata["height"] = height
+    return metadata
 
 
 class VideoDeliveryService:
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
-    async def send_message_to_chat(self, message: Message, text: str) -> None:
+    async def send_message_to_chat(self, target: DeliveryTarget, text: str) -> None:
         await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=target.chat_id,
             text=text,
-            message_thread_id=message.message_thread_id,
+            message_thread_id=target.thread_id,
         )
 
     async def handle_video_sending(
         self,
-        message: Message,
+        target: DeliveryTarget,
         file_path: str,
         caption: str,
         video_dir: str,
         user_mention: str,
         url: str,
-    ) -> None:
+    ) -> list[CachedMedia] | None:
+        """The delivered file_ids; None when delivered without a reusable file_id for every part, [] on failure."""
         try:
             file_size = os.path.getsize(file_path)
             file_size_mb = bytes_to_mb(file_size)
             logging.info("File size: %.2fMB", file_size_mb)
 
             if file_size <= MAX_SINGLE_FILE_SIZE:
-                await self.send_single_video(message, file_path, caption)
-            elif file_size <= MAX_TOTAL_FILE_SIZE:
-                await self.send_split_video(message, file_path, video_dir, user_mention, url)
-            else:
-                await self.send_message_to_chat(
-                    message,
-                    MESSAGES["file_extremely_large"].format(round(file_size_mb, 2)),
-                )
+                sent = await self.send_single_video(target, file_path, caption)
+                return [sent] if sent else None
+            if file_size <= MAX_TOTAL_FILE_SIZE:
+                return await self.send_oversized_video(target, file_path, caption, video_dir, user_mention, url)
+            await self.send_message_to_chat(
+                target,
+                MESSAGES["file_extremely_large"].format(round(file_size_mb, 2)),
+            )
         except Exception as exc:
-            await self.send_message_to_chat(message, MESSAGES["error_send"].format(str(exc)))
+            await self.send_message_to_chat(target, MESSAGES["error_send"].format(str(exc)))
             logging.error("Error sending video: %s", exc)
+        return []
+
+    async def send_cached_media(
+        self,
+        target: DeliveryTarget,
+        parts: list[CachedMedia],
+        caption: str,
+        user_mention: str,
+        url: str,
+    ) -> None:
+        total_parts = len(parts)
+        for index, part in enumerate(parts, 1):
+            part_caption = caption if total_parts == 1 else self.get_part_caption(index, total_parts, user_mention, url)
+            await self._retry_flood(lambda: self._send_cached_part(target, part, part_caption))
+
+    async def _send_cached_part(self, target: DeliveryTarget, part: CachedMedia, caption: str) -> Message:
+        kwargs = {
+            "chat_id": target.chat_id,
+            "caption": caption,
+            "message_thread_id": target.thread_id,
+        }
+        if part.kind == "document":
+            return await self.bot.send_document(document=part.file_id, **kwargs)
+        if part.kind == "animation":
+            return await self.bot.send_animation(animation=part.file_id, **kwargs)
+        return await self.bot.send_video(video=part.file_id, **kwargs)
 
-    async def send_single_video(self, message: Message, file_path: str, caption: str) -> None:
-        video = FSInputFile(file_path)
+    async def send_single_video(self, target: DeliveryTarget, file_path: str, caption: str) -> CachedMedia | None:
+        video = input_file(file_path)
         video_dir = os.path.dirname(file_path)
+        info = await ensure_faststart(file_path)
         thumbnail_path = await create_thumbnail(file_path, video_dir)
 
         kwargs = {
-            "chat_id": message.chat.id,
+            "chat_id": target.chat_id,
             "video": video,
             "caption": caption,
-            "message_thread_id": message.message_thread_id,
+            "message_thread_id": target.thread_id,
         }
         if thumbnail_path:
-            kwargs["thumbnail"] = FSInputFile(thumbnail_path)
-        await self.bot.send_video(**kwargs)
+            kwargs["thumbnail"] = input_file(thumbnail_path)
+        if info:
+            kwargs.update(video_metadata(info.duration, info.width, info.height))
+            kwargs["supports_streaming"] = info.moov_at_front
+        started = time.monotonic()
+        sent = await self._retry_flood(lambda: self.bot.send_video(**kwargs))
+        upload_seconds = time.monotonic() - started
+        metrics.observe("upload_seconds", upload_seconds)
+        logging.info("Uploaded %s in %.2fs", file_path, upload_seconds)
+        return cached_media_from_message(sent)
 
-    async def send_split_video(
+    async def send_oversized_video(
         self,
-        message: Message,
+        target: DeliveryTarget,
         file_path: str,
+        caption: str,
         video_dir: str,
         user_mention: str,
         url: str,
-    ) -> None:
+    ) -> list[CachedMedia] | None:
         file_size_mb = bytes_to_mb(os.path.getsize(file_path))
         temp_msg = await self.bot.send_message(
-            chat_id=message.chat.id,
+            chat_id=target.chat_id,
             text=MESSAGES["file_too_large"].format(round(file_size_mb, 2)),
-            message_thread_id=message.message_thread_id,
+            message_thread_id=target.thread_id,
         )
+        if FIT_TRANSCODE:
+            fitted_path = await fit_video_to_size(file_path, video_dir, MAX_SINGLE_FILE_SIZE)
+            if fitted_path:
+                await self._delete_quietly(temp_msg)
+                sent = await self.send_single_video(target, fitted_path, caption)
+                return [sent] if sent else None
+        return await self.send_split_video(target, file_path, video_dir, user_mention, url, temp_msg)
 
-        parts, total_parts = await split_video_with_ffmpeg(file_path, video_dir)
-        await temp_msg.delete()
-
-        if parts and total_parts > 0:
-            await self.send_video_parts(message, parts, total_parts, user_mention, url)
-        else:
-            await self.send_message_to_chat(message, MESSAGES["splitting_error"])
+    async def send_split_video(
+        self,
+        target: DeliveryTarget,
+        file_path: str,
+        video_dir: str,
+        user_mention: str,
+        url: str,
+        temp_msg: Message,
+    ) -> list[CachedMedia] | None:
+        progress = SplitProgress()
+        parts = prefetch(iter_video_parts(file_path, video_dir, progress), SPLIT_LOOKAHEAD_PARTS)
+        try:
+            return await self.send_video_parts(target, parts, progress, user_mention, url, temp_msg)
+        except SplitError as exc:
+            logging.error("Error splitting video: %s", exc)
+            await self.send_message_to_chat(target, MESSAGES["splitting_error"])
+            return []
+        finally:
+            await parts.aclose()
+            await self._delete_quietly(temp_msg)
 
     async def send_video_parts(
         self,
-        message: Message,
-        parts: list[str],
-        total_parts: int,
+        target: DeliveryTarget,
+        parts: AsyncIterator[VideoPart],
+        progress: SplitProgress,
         user_mention: str,
         url: str,
-    ) -> None:
-        for index, part_path in enumerate(parts, 1):
-            part_size_mb = bytes_to_mb(os.path.getsize(part_path))
-            caption = self.get_part_caption(index, total_parts, user_mention, url)
-            logging.info("Sending part %s/%s, size: %.2fMB", index, total_parts, part_size_mb)
-            await self.send_video_part(message, part_path, caption, index)
+        status_message: Message | None = None,
+    ) -> list[CachedMedia] | None:
+        """Upload parts in order while later ones are still being cut; each file is removed once sent."""
+        if PART_UPLOAD_MODE in ("parallel", "album"):
+            if PART_UPLOAD_STAGING_CHAT_ID:
+                return await self._send_parts_staged(
+                    target, parts, progress, user_mention, url, status_message, album=PART_UPLOAD_MODE == "album"
+                )
+            logging.debug("PART_UPLOAD_MODE=%s without a staging chat, uploading sequentially", PART_UPLOAD_MODE)
+
+        started = time.monotonic()
+        sent_parts: list[CachedMedia] = []
+        index = 0
+        async for part in parts:
+            index += 1
+            if status_message is not None:
+                await self._delete_quietly(status_message)
+                status_message = None
+            part_size_mb = bytes_to_mb(os.path.getsize(part.path))
+            caption = self.get_part_caption(index, progress.total_parts, user_mention, url, show_total=False)
+            logging.info("Sending part %s/%s, size: %.2fMB", index, progress.total_parts, part_size_mb)
+            sent = await self.send_video_part(target, part, caption)
+            remove_video_part(part)
+            if sent:
+                if not sent_parts:
+                    self._record_first_part(started)
+                sent_parts.append(sent)
+
+        metrics.observe("split_delivery_seconds", time.monotonic() - started)
+        return delivered_parts(sent_parts, index)
+
+    async def _send_parts_staged(
+        self,
+        target: DeliveryTarget,
+        parts: AsyncIterator[VideoPart],
+        progress: SplitProgress,
+        user_mention: str,
+        url: str,
+        status_message: Message | None,
+        album: bool,
+    ) -> list[CachedMedia] | None:
+        """Upload parts concurrently to the staging chat, then re-send them to the user in order by file_id."""
+        limiter = AimdLimiter(PART_UPLOAD_CONCURRENCY, name="Part upload")
+        staged: asyncio.Queue[tuple[VideoPart, asyncio.Task] | None] = asyncio.Queue()
+        started = time.monotonic()
+        sender = asyncio.create_task(
+            self._send_staged_in_order(target, staged, progress, user_mention, url, album, started)
+        )
+        uploads: list[asyncio.Task] = []
+        iterator = aiter(parts)
+        try:
+            while True:
+                # Taking a slot before pulling the next part keeps unsent parts on disk bounded.
+                await limiter.acquire()
+                if sender.done():
+                    # The in-order sender failed; surface its error instead of staging more parts.
+                    await limiter.release()
+                    return sender.result()
+                try:
+                    part = await anext(iterator)
+                except BaseException:
+                    await limiter.release()
+                    raise
+                if status_message is not None:
+                    await self._delete_quietly(status_message)
+                    status_message = None
+                task = asyncio.create_task(self._stage_part(part, limiter))
+                uploads.append(task)
+                staged.put_nowait((part, task))
+        except StopAsyncIteration:
+            staged.put_nowait(None)
+            result = await sender
+            metrics.observe("split_delivery_seconds", time.monotonic() - started)
+            return result
+        finally:
+            if not sender.done():
+                sender.cancel()
+            for task in uploads:
+                task.cancel()
+            await asyncio.gather(sender, *uploads, return_exceptions=True)
+
+    async def _stage_part(self, part: VideoPart, limiter: AimdLimiter) -> Message | None:
+        """Upload a part to the staging chat; the file is kept when staging fails, for a direct upload."""
+        try:
+            staged = await self._retry_flood(
+                lambda: self._upload_part(PART_UPLOAD_STAGING_CHAT_ID, None, part, None, disable_notification=True),
+                limiter,
+            )
+        except Exception as exc:
+            logging.error("Staging upload of %s failed: %s", part.path, exc)
+            return None
+        finally:
+            await limiter.release()
+        if cached_media_from_message(staged):
+            remove_video_part(part)
+        return staged
+
+    async def _send_staged_in_order(
+        self,
+        target: DeliveryTarget,
+        staged: asyncio.Queue[tuple[VideoPart, asyncio.Task] | None],
+        progress: SplitProgress,
+        user_mention: str,
+        url: str,
+        album: bool,
+        started: float,
+    ) -> list[CachedMedia] | None:
+        sent_parts: list[CachedMedia] = []
+        staging_message_ids: list[int] = []
+        batch: list[CachedMedia] = []
+        index = 0
+
+        async def flush_album() -> None:
+            nonlocal batch
+            if not sent_parts:
+                self._record_first_part(started)
+            first_index = index - len(batch) + 1
+            sent_parts.extend(await self._send_album(target, batch, first_index, progress, user_mention, url))
+            batch = []
+
+        try:
+            while (item := await staged.get()) is not None:
+                part, task = item
+                staged_message = await task
+                media = cached_media_from_message(staged_message) if staged_message else None
+                if staged_message:
+                    staging_message_ids.append(staged_message.message_id)
+                if media is None and batch:
+                    # Earlier parts go out before the one uploaded directly, keeping the order.
+                    await flush_album()
+                index += 1
+                caption = self.get_part_caption(index, progress.total_parts, user_mention, url, show_total=False)
+                if media is None:
+                    # Upload the part straight to the user rather than leave a gap; failing here aborts delivery.
+                    logging.warning("Part %s/%s failed to stage, uploading it directly", index, progress.total_parts)
+                    try:
+                        media = await self.send_video_part(target, part, caption)
+                    finally:
+                        remove_video_part(part)
+                    if media is None:
+                        continue
+                elif album:
+                    batch.append(media)
+                    if len(batch) == ALBUM_MAX_ITEMS:
+                        await flush_album()
+                    continue
+                else:
+                    await self._retry_flood(lambda: self._send_cached_part(target, media, caption))
+                if not sent_parts:
+                    self._record_first_part(started)
+                sent_parts.append(media)
+            if batch:
+                await flush_album()
+        finally:
+            await self._delete_staging_messages(staging_message_ids)
+        return delivered_parts(sent_parts, index)
+
+    async def _send_album(
+        self,
+        target: DeliveryTarget,
+        batch: list[CachedMedia],
+        first_index: int,
+        progress: SplitProgress,
+        user_mention: str,
+        url: str,
+    ) -> list[CachedMedia]:
+        captions = [
+            self.get_part_caption(first_index + offset, progress.total_parts, user_mention, url, show_total=False)
+            for offset in range(len(batch))
+        ]
+        kinds = {media.kind for media in batch}
+        if len(batch) < 2 or len(kinds) > 1 or kinds == {"animation"}:
+            # Albums need at least two videos or two documents; kinds cannot be mixed and animations are not allowed.
+            for media, caption in zip(batch, captions):
+                await self._retry_flood(
+                    lambda media=media, caption=caption: self._send_cached_part(target, media, caption)
+                )
+            return list(batch)
+
+        input_type = InputMediaDocument if kinds == {"document"} else InputMediaVideo
+        await self._retry_flood(
+            lambda: self.bot.send_media_group(
+                chat_id=target.chat_id,
+                media=[input_type(media=media.file_id, caption=caption) for media, caption in zip(batch, captions)],
+                message_thread_id=target.thread_id,
+            )
+        )
+        return list(batch)
+
+    async def _delete_staging_messages(self, message_ids: list[int]) -> None:
+        for start in range(0, len(message_ids), 100):
+            try:
+                await self.bot.delete_messages(
+                    chat_id=PART_UPLOAD_STAGING_CHAT_ID,
+                    message_ids=message_ids[start : start + 100],
+                )
+            except TelegramAPIError as exc:
+                logging.warning("Could not delete staged part messages: %s", exc)
+
+    @staticmethod
+    def _record_first_part(started: float) -> None:
+        elapsed = time.monotonic() - started
+        metrics.observe("split_time_to_first_part_seconds", elapsed)
+        logging.info("First part delivered %.2fs after splitting started", elapsed)
+
+    @staticmethod
+    async def _retry_flood(
+        factory: Callable[[], Awaitable[T]],
+        limiter: AimdLimiter | None = None,
+        attempts: int = TELEGRAM_FLOOD_RETRIES,
+    ) -> T:
+        """The one retry layer for uploads: the rate scheduler raises their flood waits straight through."""
+        attempt = 1
+        while True:
+            try:
+                result = await factory()
+            except TelegramRetryAfter as exc:
+                if limiter:
+                    limiter.on_backoff()
+                if attempt >= attempts:
+                    raise
+                logging.warning("Flood wait %ss (attempt %s/%s)", exc.retry_after, attempt, attempts)
+                await asyncio.sleep(exc.retry_after)
+                attempt += 1
+                continue
+            if limiter:
+                limiter.on_success()
+            return result
+
+    @staticmethod
+    async def _delete_quietly(message: Message) -> None:
+        try:
+            await message.delete()
+        except TelegramBadRequest:
+            pass
 
     @staticmethod
-    def get_part_caption(part_num: int, total_parts: int, user_mention: str, url: str) -> str:
+    def get_part_caption(part_num: int, total_parts: int, user_mention: str, url: str, show_total: bool = True) -> str:
+        """``show_total=False`` for parts sent while still cutting: a later re-split can grow the total.
+
+        ``total_parts`` still identifies the last part, since it counts every part cut so far.
+        """
+        if show_total:
+            label = MESSAGES["sending_part"].format(part_num, total_parts)
+        else:
+            label = MESSAGES["sending_part_number"].format(part_num)
         if part_num == 1:
-            return f"{MESSAGES['sending_part'].format(part_num, total_parts)}\n{user_mention}\n{url}"
+            return f"{label}\n{user_mention}\n{url}"
         if part_num == total_parts:
             return MESSAGES["sending_complete"]
-        return MESSAGES["sending_part"].format(part_num, total_parts)
+        return label
 
     async def send_video_part(
         self,
-        message: Message,
-        part_path: str,
+        target: DeliveryTarget,
+        part: VideoPart,
         caption: str,
-        part_index: int | None = None,
-    ) -> None:
-        video = FSInputFile(part_path)
-        video_dir = os.path.dirname(part_path)
-        thumbnail_path = await create_thumbnail(part_path, video_dir, part_index)
+    ) -> CachedMedia | None:
+        sent = await self._retry_flood(lambda: self._upload_part(target.chat_id, target.thread_id, part, caption))
+        return cached_media_from_message(sent)
 
+    async def _upload_part(
+        self,
+        chat_id: int,
+        message_thread_id: int | None,
+        part: VideoPart,
+        caption: str | None,
+        disable_notification: bool | None = None,
+    ) -> Message:
         try:
             kwargs = {
-                "chat_id": message.chat.id,
-                "video": video,
+                "chat_id": chat_id,
+                "video": input_file(part.path),
                 "caption": caption,
-                "message_thread_id": message.message_thread_id,
+                "message_thread_id": message_thread_id,
+                "disable_notification": disable_notification,
             }
-            if thumbnail_path:
-                kwargs["thumbnail"] = FSInputFile(thumbnail_path)
-            await self.bot.send_video(**kwargs)
+            if part.thumbnail_path:
+                kwargs["thumbnail"] = input_file(part.thumbnail_path)
+            kwargs.update(video_metadata(part.duration, part.width, part.height))
+            # Parts are cut with +faststart.
+            kwargs["supports_streaming"] = True
+            return await self.bot.send_video(**kwargs)
+        except TelegramRetryAfter:
+            raise
         except Exception as exc:
             logging.error("Error sending part as video: %s, trying as document", exc)
-            await self.bot.send_document(
-                chat_id=message.chat.id,
-                document=FSInputFile(part_path),
-                caption=f"{caption} (отправлено как файл из-за ошибки)",
-                message_thread_id=message.message_thread_id,
+            return await self.bot.send_document(
+                chat_id=chat_id,
+                document=input_file(part.path),
+                caption=f"{caption} (отправлено как файл из-за ошибки)" if caption else None,
+                message_thread_id=message_thread_id,
+                disable_notification=disable_notification,
             )
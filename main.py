@@ -2,6 +2,8 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from downloader_bot.bot.handlers import register_handlers
 from downloader_bot.bot.middleware import ChatAccessMiddleware
@@ -15,12 +17,25 @@ from downloader_bot.config import (
     BUSINESS_BOT_URL,
     COBALT_API_URL,
     DOWNLOADER_URL,
+    METRICS_PORT,
+    PART_UPLOAD_MODE,
+    PART_UPLOAD_STAGING_CHAT_ID,
     RELAY_OWNER_USER_ID,
     RELAY_TIMEOUT_SECONDS,
+    TELEGRAM_API_LOCAL,
+    TELEGRAM_API_URL,
+    TELEGRAM_REQUEST_TIMEOUT_SECONDS,
 )
 from downloader_bot.infrastructure.cobalt_health import check_cobalt_reachable
+from downloader_bot.infrastructure.file_id_cache import FileIdCache
+from downloader_bot.infrastructure.http_client import HttpClient
+from downloader_bot.infrastructure.metrics_server import start_metrics_server
+from downloader_bot.infrastructure.relay_ledger import RelayLedger
+from downloader_bot.infrastructure.telegram_scheduler import TelegramRateScheduler
 from downloader_bot.infrastructure.temp_files import clean_data_dir, ensure_data_dir
-from downloader_bot.services.download_service import DownloadService
+from downloader_bot.services.backend_router import BackendRouter
+from downloader_bot.services.download_service import BACKEND_COBALT, BACKEND_DOWNLOADER, DownloadService
+from downloader_bot.services.job_scheduler import JobScheduler
 from downloader_bot.services.relay_service import RelayService
 from downloader_bot.services.video_delivery import VideoDeliveryService
 
@@ -46,8 +61,21 @@ async def main():
         ALLOWED_GROUP_ID,
         BUSINESS_BOT_URL,
     )
+    if PART_UPLOAD_MODE in ("parallel", "album") and not PART_UPLOAD_STAGING_CHAT_ID:
+        logging.warning(
+            "PART_UPLOAD_MODE=%s needs PART_UPLOAD_STAGING_CHAT_ID; parts will be uploaded sequentially",
+            PART_UPLOAD_MODE,
+        )
+
+    http_client = HttpClient()
+    try:
+        await run_bot(http_client)
+    finally:
+        await http_client.close()
+
 
-    business_client = BusinessRelayClient()
+async def run_bot(http_client: HttpClient) -> None:
+    business_client = BusinessRelayClient(http_client)
     business_ok, business_message = await business_client.check_health()
     if business_ok:
         logging.info("Business bot reachable: %s", business_message)
@@ -58,7 +86,7 @@ async def main():
             business_message,
         )
 
-    cobalt_ok, cobalt_message = await check_cobalt_reachable()
+    cobalt_ok, cobalt_message = await check_cobalt_reachable(http_client)
     if cobalt_ok:
         logging.info("Cobalt reachable: %s", cobalt_message)
     else:
@@ -68,17 +96,53 @@ async def main():
             cobalt_message,
         )
 
-    bot = Bot(token=BOT_TOKEN)
+    session = None
+    if TELEGRAM_API_URL:
+        logging.info("Using Bot API server at %s (local mode: %s)", TELEGRAM_API_URL, TELEGRAM_API_LOCAL)
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=TELEGRAM_API_LOCAL),
+            timeout=TELEGRAM_REQUEST_TIMEOUT_SECONDS,
+        )
+    bot = Bot(token=BOT_TOKEN, session=session)
+    scheduler = TelegramRateScheduler()
+    bot.session.middleware(scheduler)
     dp = Dispatcher()
     dp.message.middleware(ChatAccessMiddleware())
     dp.inline_query.middleware(ChatAccessMiddleware())
-    download_service = DownloadService(CobaltClient(), YtdlpClient())
+    router = BackendRouter([BACKEND_COBALT, BACKEND_DOWNLOADER])
+    download_service = DownloadService(CobaltClient(http_client), YtdlpClient(http_client), router)
     delivery_service = VideoDeliveryService(bot)
-    relay_service = RelayService(bot, download_service, delivery_service, business_client)
-    register_handlers(dp, bot, download_service, delivery_service, relay_service)
+    file_id_cache = FileIdCache()
+    relay_ledger = RelayLedger()
+    job_scheduler = JobScheduler(bot)
+    relay_service = RelayService(
+        bot, download_service, delivery_service, business_client, file_id_cache, relay_ledger, job_scheduler
+    )
+    register_handlers(dp, bot, download_service, delivery_service, relay_service, http_client)
     register_relay_handlers(dp, relay_service)
 
-    await dp.start_polling(bot)
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(
+            {
+                "backends": router.snapshot,
+                "telegram": scheduler.snapshot,
+                "relay_latency": relay_service.latency.snapshot,
+                "jobs": job_scheduler.snapshot,
+            },
+            METRICS_PORT,
+        )
+
+    try:
+        await relay_service.restore()
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        file_id_cache.close()
+        relay_ledger.close()
+        await scheduler.close()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
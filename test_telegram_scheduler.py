@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Тесты планировщика исходящих вызовов Bot API
+"""
+
+import asyncio
+import os
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText
+
+from downloader_bot.infrastructure.telegram_scheduler import TelegramRateScheduler
+
+GROUP_CHAT_ID = -100123
+
+
+class RecordingSession(BaseSession):
+    """Сессия без сети: запоминает вызовы и отвечает успехом."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+async def _with_bot(scheduler, scenario):
+    session = RecordingSession()
+    session.middleware(scheduler)
+    bot = Bot("42:TEST", session=session)
+    try:
+        return await scenario(bot, session)
+    finally:
+        await scheduler.close()
+
+
+def test_coalesced_edit_returns_true():
+    """Вытесненное более новой правкой редактирование возвращает True, а не объект Response"""
+
+    async def scenario(bot, session):
+        # Исчерпываем глобальный бакет, чтобы правки встали в очередь.
+        await bot.send_message(chat_id=1, text="a")
+        await bot.send_message(chat_id=2, text="b")
+        first = asyncio.create_task(bot.edit_message_text(text="old", chat_id=1, message_id=10))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(bot.edit_message_text(text="new", chat_id=1, message_id=10))
+        return await first, await second, session.calls
+
+    coalesced, latest, calls = asyncio.run(_with_bot(TelegramRateScheduler(global_rate=2), scenario))
+    assert coalesced is True
+    assert latest is True
+    edits = [call for call in calls if isinstance(call, EditMessageText)]
+    assert [edit.text for edit in edits] == ["new"]
+
+
+def test_group_edits_are_not_charged_to_the_chat():
+    """Правки служебных сообщений в группе не расходуют поминутный лимит группы"""
+
+    async def scenario(bot, session):
+        started = time.monotonic()
+        await asyncio.gather(
+            *(bot.edit_message_text(text="…", chat_id=GROUP_CHAT_ID, message_id=index) for index in range(10))
+        )
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(
+        _with_bot(TelegramRateScheduler(global_rate=100, group_rate_per_minute=1, chat_burst=1), scenario)
+    )
+    assert elapsed < 1
+
+
+if __name__ == "__main__":
+    test_coalesced_edit_returns_true()
+    test_group_edits_are_not_charged_to_the_chat()
+    print("ok")